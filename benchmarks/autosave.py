@@ -0,0 +1,47 @@
+"""Benchmark for the autosave of large graphs.
+Opens synthetic save files of 10k, 100k and 1M lines (see benchmarks/load_time.py), then runs an autosave the same way
+as the main loop: Autosave.update is called once per frame until the graph is copied, and the worker thread writes it.
+Measures the number of frames taken by the copy, the longest of them, and the time taken by the worker thread.
+
+Run with: python benchmarks/autosave.py"""
+
+import os, sys, tempfile
+from random import Random
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from load_time import SIZES, write_save
+from progression_graph import Autosave, Manager, graph
+
+def main():
+    rng = Random(0)
+    print('%10s %10s %16s %14s' %('lines', 'frames', 'max frame (ms)', 'write (s)'))
+    with tempfile.TemporaryDirectory() as folder:
+        Autosave.folder = folder
+        Autosave.interval = 0
+        for n_lines in SIZES:
+            file = os.path.join(folder, '%d.graph' %n_lines)
+            write_save(file, n_lines, rng)
+            graph.open(file)
+            graph.edited(next(iter(Manager.nodes.values())))
+
+            frames, longest = 0, 0
+            while True:
+                t = perf_counter()
+                graph.autosave.update(graph)
+                longest = max(longest, perf_counter()-t)
+                frames += 1
+                if not graph.autosave.copying(): break
+
+            t = perf_counter()
+            graph.autosave.thread.join()
+            write = perf_counter()-t
+            print('%10d %10d %16.2f %14.2f' %(n_lines, frames, longest*1000, write))
+
+            graph.autosave.discard(file)
+            graph.newfile()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark for the binary save format (save.bin, see BinaryFormat) against the text format (save.txt).
+Converts synthetic save files of 10k, 100k and 1M lines (see benchmarks/load_time.py) to the binary format
+with Graph.convert, then compares the file sizes, the time taken by reading the snapshot entry alone
+(the save.txt tokenizer, or the save.bin tables), by the whole Graph.open and by Graph.compact.
+
+Run with: python benchmarks/binary_format.py"""
+
+import os, sys, tempfile
+from random import Random
+from zipfile import ZipFile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from load_time import SIZES, write_save, timed, tokenize
+from progression_graph import BinaryFormat, Manager, entry_view, graph, map_file
+
+def state():
+    """Returns the nodes and links of the opened file, to check that the conversion keeps them"""
+    return ({id: (round(node.x, 5), round(node.y, 5), node.rank, node.state, node.text) for id, node in Manager.nodes.items()},
+            {id: (link.n1.id, link.n2.id) for id, link in Manager.links.items()})
+
+def read_binary(file):
+    with ZipFile(file) as z:
+        memory = map_file(file)
+        view = entry_view(z, 'save.bin', memory)
+        camera, sizes, tables, string = BinaryFormat.read(view)
+        for rows in tables:
+            for _ in rows(): pass
+        del rows, tables, string
+        view.release()
+        memory.close()
+
+def main():
+    rng = Random(0)
+    print('%10s %8s %14s %10s %10s %12s' %('lines', 'format', 'file (bytes)', 'read (s)', 'open (s)', 'compact (s)'))
+    with tempfile.TemporaryDirectory() as folder:
+        for n_lines in SIZES:
+            text = os.path.join(folder, '%d.graph' %n_lines)
+            binary = os.path.join(folder, '%d.bin.graph' %n_lines)
+            write_save(text, n_lines, rng)
+            graph.convert(text, binary, True)
+
+            states = []
+            for name, file, read in (('text', text, tokenize), ('binary', binary, read_binary)):
+                read = timed(read, file)
+                load = timed(graph.open, file)
+                states.append(state())
+                compact = timed(graph.compact)
+                print('%10d %8s %14d %10.2f %10.2f %12.2f' %(n_lines, name, os.path.getsize(file), read, load, compact))
+            assert states[0] == states[1], 'graphs differ after conversion'
+            graph.newfile()
+
+if __name__ == '__main__':
+    main()
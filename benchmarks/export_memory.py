@@ -0,0 +1,59 @@
+"""Peak memory and time taken by Graph.export_file, which renders the image by bands of tiles and streams them
+into the png file, on square graphs of increasing size: up to 50000x50000 pixels, which would take 10 GB
+as a single surface. Each export runs in a new process, and reports its peak resident memory, graph included.
+Unix only (resource module).
+
+Run with: python benchmarks/export_memory.py"""
+
+import os, sys, subprocess, tempfile, resource
+from random import Random
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import Graph, Manager, Node, graph
+
+SIZES = (5000, 20000, 50000) # width and height of the exported images, in pixels
+SPACING = 4 # distance between the nodes, in graph units
+
+def build(size, rng):
+    """Fills the Manager with nodes on a jittered grid covering size pixels, linked to their neighbours"""
+    Manager.reset()
+    n = int(size / Graph.unit_size / SPACING)
+    grid = {}
+    for i in range(n):
+        for j in range(n):
+            node = grid[i, j] = Manager.new_node(i*SPACING + rng.uniform(-1, 1), j*SPACING + rng.uniform(-1, 1),
+                                                 rng.randrange(Node.N_RANKS), rng.randrange(3))
+            if rng.random() < 0.1: Manager.attach_text(node.id, 'node %d %d' %(i, j))
+    for (i, j), node in grid.items():
+        for neighbour in (grid.get((i+1, j)), grid.get((i, j+1))):
+            if neighbour is not None: Manager.new_link(node.id, neighbour.id)
+
+def peak_rss():
+    """Returns the peak resident memory of the process, in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure(size, file):
+    """Exports a graph of size pixels, prints the time taken, the image size and the peak memory"""
+    build(int(size), Random(0))
+    t = perf_counter()
+    graph.export_file(file, False)
+    print(perf_counter() - t, os.path.getsize(file), peak_rss())
+
+def main():
+    if len(sys.argv) == 3:
+        measure(*sys.argv[1:])
+        return
+
+    print('%8s %10s %12s %12s %14s %14s' %('size', 'nodes', 'export (s)', 'file (MB)', 'peak RSS (MB)', 'surface (MB)'))
+    with tempfile.TemporaryDirectory() as folder:
+        file = os.path.join(folder, 'export.png')
+        for size in SIZES:
+            output = subprocess.run([sys.executable, __file__, str(size), file], capture_output=True, text=True, check=True).stdout
+            t, file_size, peak = map(float, output.split()[-3:])
+            nodes = int(size / Graph.unit_size / SPACING) ** 2
+            print('%8d %10d %12.1f %12.1f %14.0f %14.0f' %(size, nodes, t, file_size / 1024**2, peak / 1024**2, size*size*4 / 1024**2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Peak memory taken by decoding the images of a save file, with Image.decode reading the entries as views
+of the memory-mapped file, against the previous decoding that sliced copies of the entries read in memory.
+Writes a save file with large images in the legacy format (raw RGBA data, stored without compression),
+then decodes all of them in a new process for each method, and reports the peak resident memory above
+the memory taken before decoding, compared to the size of the decoded images. Linux only (/proc/self/statm).
+
+Run with: python benchmarks/image_memory.py"""
+
+import os, sys, subprocess, tempfile, resource
+from random import Random
+from zipfile import ZipFile, ZIP_STORED
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pygame
+from progression_graph import Manager, graph
+
+N_IMAGES = 8
+SIZE = 2048 # width and height of the images, in pixels
+
+def write_save(file, rng):
+    """Writes a save file with N_IMAGES legacy images of random pixels, attached to as many nodes"""
+    lines = ['_S 100000 100000', '_Z 1'] # the camera is away from the nodes, their images are not decoded when opening
+    with ZipFile(file, 'w') as z:
+        for i in range(N_IMAGES):
+            z.writestr('image%d.png' %i, b'%d.%d.' %(SIZE, SIZE) + rng.randbytes(SIZE*SIZE*4), ZIP_STORED)
+            lines += ['P %d 0 0 0 %d' %(i*2, i), 'I image%d.png %d' %(i, i), 'Ai %d %d' %(i, i)]
+        z.writestr('save.txt', '\n'.join(lines)+'\n')
+
+def legacy_decode(image):
+    """Previous decoding of the legacy entries, kept for comparison"""
+    with ZipFile(image.source[0]) as z:
+        content = z.read(image.source[1])
+    i = content.index(b'.')
+    w = int(content[:i].decode())
+    content = content[i+1:]
+    i = content.index(b'.')
+    h = int(content[:i].decode())
+    content = content[i+1:]
+    return pygame.image.frombytes(content, (w, h), 'RGBA')
+
+def rss():
+    """Returns the current resident memory of the process, in bytes"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+def peak_rss():
+    """Returns the peak resident memory of the process, in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure(method, file):
+    """Decodes all the images of file with a method, prints the peak memory above the one before decoding, in MB"""
+    graph.open(file)
+    images = list(Manager.images.values())
+    start = rss()
+    surfs = [legacy_decode(image) if method == 'legacy' else image.surf for image in images]
+    assert all(surf.get_size() == (SIZE, SIZE) for surf in surfs), 'images not decoded'
+    print((peak_rss() - start) / 1024**2)
+
+def run(method, file):
+    output = subprocess.run([sys.executable, __file__, method, file], capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+def main():
+    if len(sys.argv) == 3:
+        measure(*sys.argv[1:])
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        file = os.path.join(folder, 'images.graph')
+        write_save(file, Random(0))
+        decoded = N_IMAGES * SIZE*SIZE*4 / 1024**2
+        print('%d images of %dx%d, %.0f MB decoded' %(N_IMAGES, SIZE, SIZE, decoded))
+        print('%10s %14s %16s' %('method', 'peak (MB)', 'overhead (MB)'))
+        for method in ('legacy', 'view'):
+            peak = run(method, file)
+            print('%10s %14.0f %16.0f' %(method, peak, peak - decoded))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Size and time comparison of the image entries formats of the save files, on the bundled minecraft.graph.
+The bundled file uses the legacy format (raw RGBA data, stored without compression), it is saved again
+with PNG entries and a deflated save.txt, then both files are compared: file size, size of the image entries,
+and time taken to open the file and decode all of its images.
+
+Run with: python benchmarks/image_storage.py"""
+
+import os, sys, shutil, tempfile
+from time import perf_counter
+from zipfile import ZipFile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pygame
+from progression_graph import Manager, graph
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'minecraft.graph')
+RUNS = 50
+
+def image_bytes(file):
+    """Returns the total size of the image entries in a save file, in bytes"""
+    with ZipFile(file) as z:
+        return sum(info.compress_size for info in z.infolist() if info.filename != 'save.txt')
+
+def load_time(file):
+    """Returns the mean time taken to open a save file and decode all its images, in ms"""
+    t = perf_counter()
+    for _ in range(RUNS):
+        graph.open(file)
+        for image in Manager.images.values(): image.surf
+    return (perf_counter() - t) / RUNS * 1000
+
+def pixels(file):
+    """Returns the pixels of the image of each node in a save file"""
+    graph.open(file)
+    return {id: pygame.image.tostring(node.image.surf, 'RGBA') for id, node in Manager.nodes.items() if node.image is not None}
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        legacy = os.path.join(folder, 'legacy.graph')
+        png = os.path.join(folder, 'png.graph')
+        shutil.copy(SOURCE, legacy)
+
+        graph.open(legacy)
+        graph.save_file = png
+        graph.save()
+        assert pixels(legacy) == pixels(png), 'images differ after saving'
+
+        print('%8s %14s %14s %14s' %('format', 'file (bytes)', 'images (bytes)', 'open (ms)'))
+        for name, file in (('legacy', legacy), ('png', png)):
+            print('%8s %14d %14d %14.2f' %(name, os.path.getsize(file), image_bytes(file), load_time(file)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark for the link culling stage of Graph.update.
+Builds a random graph with 100k links, then compares the time taken by the spatial index query
+to the time of clipping every link against the viewport, for several zoom levels.
+The results of both methods are also checked to be the same.
+With NumPy, the zoomed out queries clip all the links at once, see SpatialGrid.links_in_rect.
+
+Run with: python benchmarks/link_culling.py"""
+
+import os, sys
+from random import Random
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import SpatialGrid
+
+N_NODES = 20000
+N_LINKS = 100000
+SPREAD = 200 # graph units
+FRAMES = 20
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+class Segment:
+    def __init__(self, n1, n2):
+        self.n1, self.n2 = n1, n2
+
+def build(rng):
+    """Returns a spatial grid filled with random nodes and links, and the list of links.
+    The objects are stand-ins with only the attributes the grid uses"""
+    grid = SpatialGrid()
+    nodes = [Point(rng.uniform(0, SPREAD), rng.uniform(0, SPREAD)) for _ in range(N_NODES)]
+    links = []
+    for i in range(N_LINKS):
+        n1 = rng.choice(nodes)
+        # mostly short links, with some long ones crossing the whole graph
+        if i%20: n2 = min(rng.sample(nodes, 8), key=lambda n: (n.x-n1.x)**2 + (n.y-n1.y)**2)
+        else: n2 = rng.choice(nodes)
+        links.append(Segment(n1, n2))
+
+    for node in nodes: grid.add_node(node)
+    for link in links: grid.add_link(link)
+    return grid, links
+
+def main():
+    rng = Random(0)
+    t = perf_counter()
+    grid, links = build(rng)
+    print('built %d nodes, %d links in %.2fs' %(N_NODES, N_LINKS, perf_counter()-t))
+
+    # view rectangle sizes, in graph units: 900x500 pixels at various zooms
+    print('%8s %10s %14s %14s' %('zoom', 'visible', 'index (ms)', 'linear (ms)'))
+    for zoom in (4, 1, 0.25, 0.1, 0.05):
+        w, h = 9/zoom, 5/zoom
+        rects = []
+        for _ in range(FRAMES):
+            x, y = rng.uniform(0, SPREAD), rng.uniform(0, SPREAD)
+            rects.append((x-w/2, y-h/2, x+w/2, y+h/2))
+
+        t = perf_counter()
+        results = [grid.query(rect)[1] for rect in rects]
+        t_index = (perf_counter()-t) / FRAMES
+
+        t = perf_counter()
+        expected = [{link for link in links if SpatialGrid.segment_in_rect(link.n1.x, link.n1.y, link.n2.x, link.n2.y, rect)}
+                    for rect in rects]
+        t_linear = (perf_counter()-t) / FRAMES
+
+        assert results == expected, 'culling results differ'
+        visible = sum(len(r) for r in results) / FRAMES
+        print('%8g %10d %14.2f %14.2f' %(zoom, visible, t_index*1000, t_linear*1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark for the link drawing stage of Graph.render.
+Builds a random graph with 20k nodes and 50k short links, then compares the time taken by drawing
+the visible links one by one with Link.update to the time of the batched Link.draw_all, for several zoom levels.
+Both methods draw the same lines, only the order of the overlapping links of different colors changes.
+
+Run with: python benchmarks/link_drawing.py"""
+
+import os, sys
+from random import Random
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pygame
+from progression_graph import Manager, Link, Node, graph, screen
+
+N_NODES = 20000
+N_LINKS = 50000
+SPREAD = 200 # graph units
+FRAMES = 5
+
+def build(rng):
+    """Fills the Manager with random nodes, and links between close nodes"""
+    Manager.reset()
+    nodes = [Manager.new_node(rng.uniform(0, SPREAD), rng.uniform(0, SPREAD),
+                              rng.randrange(Node.N_RANKS), rng.randrange(3)) for _ in range(N_NODES)]
+    while len(Manager.links) < N_LINKS:
+        n1 = rng.choice(nodes)
+        near = [node for node in Manager.grid.nodes_in_rect(n1.x-4, n1.y-4, n1.x+4, n1.y+4) if node is not n1]
+        if not near: continue
+        n2 = rng.choice(near)
+        if Manager.get_link(n1, n2) is None: Manager.new_link(n1.id, n2.id)
+
+def timed(draw):
+    """Returns the best time of draw(), in ms"""
+    best = None
+    for _ in range(FRAMES):
+        t = perf_counter()
+        draw()
+        t = perf_counter() - t
+        if best is None or t < best: best = t
+    return best * 1000
+
+def main():
+    rng = Random(0)
+    t = perf_counter()
+    build(rng)
+    print('built %d nodes, %d links in %.2fs' %(N_NODES, N_LINKS, perf_counter()-t))
+
+    surf = pygame.Surface(screen.get_size())
+    graph.scroll_x = graph.scroll_y = SPREAD/2
+    print('%8s %5s %10s %16s %16s' %('zoom', 'lod', 'visible', 'per link (ms)', 'batched (ms)'))
+    for zoom in (1, 0.3, 0.1, 0.03, 0.01):
+        graph.zoom = zoom
+        lod = graph.lod()
+        links = graph.get_visible(None, False)[1]
+
+        per_link = timed(lambda: [link.update([], surf, graph.project, lod) for link in links])
+        batched = timed(lambda: Link.draw_all(links, surf, graph.project, lod))
+        print('%8g %5d %10d %16.1f %16.1f' %(zoom, lod, len(links), per_link, batched))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark for Graph.open on large save files.
+Writes synthetic save files of 10k, 100k and 1M lines (a third of nodes, links between close nodes, and texts),
+then measures the time taken by the save.txt tokenizer alone, compared to the previous character by character
+normalization of the lines, and by the whole Graph.open.
+
+Run with: python benchmarks/load_time.py"""
+
+import os, sys, tempfile
+from io import TextIOWrapper
+from random import Random
+from time import perf_counter
+from zipfile import ZipFile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import Graph, Manager, graph
+
+SIZES = (10000, 100000, 1000000) # number of lines
+
+def write_save(file, n_lines, rng):
+    """Writes a synthetic save file: nodes on a jittered grid, links to the next nodes in their row or the row below"""
+    n_nodes = n_lines // 3
+    n_texts = n_nodes // 10
+    n_links = n_lines - n_nodes - n_texts
+    cols = int(n_nodes ** 0.5) + 1
+
+    lines = ['# GENERAL INFO', '_S 0.000000 0.000000', '_Z 1.000000', '', '# NODES']
+    for i in range(n_nodes):
+        x, y = i%cols*2 + rng.uniform(-0.5, 0.5), i//cols*2 + rng.uniform(-0.5, 0.5)
+        lines.append('P %f %f %d %d %d' %(x, y, rng.randrange(5), rng.randrange(3), i))
+
+    lines += ('', '# LINKS')
+    pairs = set()
+    while len(pairs) < n_links:
+        n1 = rng.randrange(n_nodes)
+        n2 = min(n_nodes-1, n1 + rng.choice((1, 2, cols, cols+1)))
+        if n1 != n2: pairs.add((n1, n2))
+    for id, (n1, n2) in enumerate(pairs):
+        lines.append('L %d %d %d' %(n1, n2, id))
+
+    lines += ('', '# TEXT')
+    for id in range(0, n_nodes, n_nodes // n_texts):
+        lines.append('At %d node\0number\0%d' %(id, id))
+
+    with ZipFile(file, 'w') as z:
+        z.writestr('save.txt', '\n'.join(lines)+'\n')
+
+def legacy_tokenize(file):
+    """Previous line normalization of Graph.open, kept for comparison"""
+    with ZipFile(file) as z:
+        lines = z.read('save.txt').decode().split('\n')
+    for raw in lines:
+        line = ''
+        prev = ' '
+        for c in raw:
+            if c == prev == ' ': continue
+            if c == '#': break
+            line += c
+            prev = c
+        line = line.rstrip()
+        if not line: continue
+        line = line.split(' ')
+
+def tokenize(file):
+    with ZipFile(file) as z:
+        for _ in Graph.tokenize(TextIOWrapper(z.open('save.txt'), encoding='utf-8')): pass
+
+def timed(f, *args):
+    t = perf_counter()
+    f(*args)
+    return perf_counter() - t
+
+def main():
+    rng = Random(0)
+    print('%10s %10s %10s %16s %16s %12s' %('lines', 'nodes', 'links', 'legacy tok (s)', 'tokenize (s)', 'open (s)'))
+    with tempfile.TemporaryDirectory() as folder:
+        for n_lines in SIZES:
+            file = os.path.join(folder, '%d.graph' %n_lines)
+            write_save(file, n_lines, rng)
+
+            legacy = timed(legacy_tokenize, file)
+            tokens = timed(tokenize, file)
+            load = timed(graph.open, file)
+            print('%10d %10d %10d %16.2f %16.2f %12.2f' %(n_lines, len(Manager.nodes), len(Manager.links), legacy, tokens, load))
+            graph.newfile()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Memory comparison of the nodes and links representation.
+Measures the memory taken by 100k Node and 100k Link objects, and compares it to the previous layout:
+dict-backed objects, with three node surfaces allocated eagerly in Node.set_image.
+The Manager indexes are not included, as they are the same for both layouts.
+
+Run with: python benchmarks/object_memory.py"""
+
+import os, sys, tracemalloc
+from random import Random
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pygame
+from progression_graph import Manager, Node, Link, np
+
+N = 100000
+
+class DictNode:
+    """Previous Node layout, only the attributes"""
+    def __init__(self, x, y, rank, state, id):
+        self.x, self.y, self.state, self.id = x, y, state, id
+        self.text, self.image = '', None
+        self.cached_surfs = self.cached_zoom = self.text_surfs = None
+        self.rank, self.size = rank, Node.get_rank_size(rank)
+        self.surfs = [None]*3
+
+class DictLink:
+    """Previous Link layout"""
+    def __init__(self, n1, n2, id):
+        self.id, self.n1, self.n2 = id, n1, n2
+        self.rank, self.size, self.state = n1.rank, 2, n1.state
+
+def traced(build):
+    """Returns the memory allocated by Python while calling build, and its result"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+def main():
+    rng = Random(0)
+    values = [(rng.uniform(-100, 100), rng.uniform(-100, 100), rng.randrange(5), rng.randrange(3)) for _ in range(N)]
+    pairs = [(rng.randrange(N), rng.randrange(N)) for _ in range(N)]
+
+    # previous layout, the surfaces are allocated by SDL so their size is computed
+    size_nodes, nodes = traced(lambda: [DictNode(*v, i) for i, v in enumerate(values)])
+    size_links, links = traced(lambda: [DictLink(nodes[a], nodes[b], i) for i, (a, b) in enumerate(pairs)])
+    surfaces = sum(3 * node.size**2 * pygame.Surface((1, 1)).get_bytesize() for node in nodes)
+    del nodes, links
+
+    # current layout, slotted objects. With NumPy, the nodes attributes are in Manager.store
+    Manager.reset()
+    size_nodes2, nodes = traced(lambda: [Node(*v, i) for i, v in enumerate(values)])
+    size_links2, links = traced(lambda: [Link(nodes[a], nodes[b], i) for i, (a, b) in enumerate(pairs)])
+    store = 0 if Manager.store is None else sum(getattr(Manager.store, name).nbytes for name in (*Manager.store.fields, 'alive'))
+    size_nodes2 -= store # NumPy reports its allocations to tracemalloc
+
+    mb = lambda size: '%8.1f MB' %(size / 1024**2)
+    print('%d nodes, %d links, NumPy store: %s' %(N, N, 'yes' if np is not None else 'no'))
+    print('%-34s %s %s' %('', '  previous', '   current'))
+    print('%-34s %s %s' %('node objects', mb(size_nodes), mb(size_nodes2)))
+    print('%-34s %s %s' %('node surfaces (eager vs shared)', mb(surfaces), mb(0)))
+    print('%-34s %s %s' %('NumPy node store', mb(0), mb(store)))
+    print('%-34s %s %s' %('link objects', mb(size_links), mb(size_links2)))
+    print('%-34s %s %s' %('total', mb(size_nodes + surfaces + size_links), mb(size_nodes2 + store + size_links2)))
+    print('per node: %d bytes vs %d bytes (without surfaces), per link: %d bytes vs %d bytes'
+          %(size_nodes/N, (size_nodes2+store)/N, size_links/N, size_links2/N))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Benchmark for Graph.open in the background, on large save files.
+Opens synthetic save files of 10k, 100k and 1M lines (see benchmarks/load_time.py) with and without a worker thread,
+and measures the longest time between two frames of the progress bar while the file is opened in the background.
+
+Run with: python benchmarks/open_async.py"""
+
+import os, sys, tempfile
+from random import Random
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pygame
+from load_time import SIZES, write_save, timed
+from progression_graph import graph
+
+def main():
+    # record the frames of the progress bar
+    frames = []
+    flip = pygame.display.flip
+    def record():
+        frames.append(perf_counter())
+        flip()
+    pygame.display.flip = record
+
+    rng = Random(0)
+    print('%10s %12s %14s %10s %18s' %('lines', 'open (s)', 'background (s)', 'frames', 'max interval (ms)'))
+    with tempfile.TemporaryDirectory() as folder:
+        for n_lines in SIZES:
+            file = os.path.join(folder, '%d.graph' %n_lines)
+            write_save(file, n_lines, rng)
+
+            load = timed(graph.open, file)
+            graph.newfile()
+            frames.clear()
+            background = timed(graph.open, file, True)
+            interval = max((b-a for a, b in zip(frames, frames[1:])), default=0)
+            print('%10d %12.2f %14.2f %10d %18.1f' %(n_lines, load, background, len(frames), interval*1000))
+            graph.newfile()
+
+if __name__ == '__main__':
+    main()
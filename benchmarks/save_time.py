@@ -0,0 +1,48 @@
+"""Benchmark for Graph.save on large save files.
+Opens synthetic save files of 10k, 100k and 1M lines (see benchmarks/load_time.py), moves a node, then compares
+the time taken by an incremental save, appending a journal entry, to the time of a full rewrite with Graph.compact.
+The file is then opened again to measure the cost of replaying the journal.
+
+Run with: python benchmarks/save_time.py"""
+
+import os, sys, tempfile
+from random import Random
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from load_time import SIZES, write_save, timed
+from progression_graph import Manager, graph
+
+EDITS = 10 # number of incremental saves, each after moving one node
+
+def edit(rng):
+    """Moves a random node, the same way as dragging it"""
+    node = Manager.nodes[rng.choice(list(Manager.nodes))]
+    graph.edited(node, links=True)
+    Manager.move_node(node, node.x+1, node.y)
+    for link in Manager.node_links.get(node, ()): Manager.grid.update_link(link)
+
+def main():
+    rng = Random(0)
+    print('%10s %14s %14s %16s %16s' %('lines', 'full (s)', 'journal (ms)', 'open (s)', 'open+journal (s)'))
+    with tempfile.TemporaryDirectory() as folder:
+        for n_lines in SIZES:
+            file = os.path.join(folder, '%d.graph' %n_lines)
+            write_save(file, n_lines, rng)
+            graph.open(file)
+
+            edit(rng)
+            full = timed(graph.compact)
+            load = timed(graph.open, file)
+
+            journal = 0
+            for _ in range(EDITS):
+                edit(rng)
+                journal += timed(graph.save)
+            replay = timed(graph.open, file)
+            print('%10d %14.2f %14.2f %16.2f %16.2f' %(n_lines, full, journal/EDITS*1000, load, replay))
+            graph.newfile()
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,28 @@
+import gc
+import os
+import sys
+import zlib
+import mmap
+import struct
 import pygame
-from zipfile import ZipFile
-from math import sqrt, floor, log
-from os.path import exists, splitext, basename
+from hashlib import sha1
+from zipfile import ZipFile, BadZipFile, ZIP_STORED, ZIP_DEFLATED
+from io import TextIOWrapper, BytesIO
+from collections import OrderedDict
+from itertools import groupby, islice, chain, starmap
+from operator import attrgetter, itemgetter
+from heapq import heappush, heappop
+from math import sqrt, floor, log, inf, isclose
+from os.path import exists, splitext, basename, abspath, join, expanduser, getmtime
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, localtime, strftime
 from pygame.locals import *
 
-# lower fps if window inactive, but needs win32 utils to do that
-from sys import platform
-if 'win' in platform:
-    import win32gui
-else:
-    class win32gui:
-        def GetForegroundWindow(*args): return True
-
-from tkinter.filedialog import askopenfilename, asksaveasfilename
+try:
+    import numpy as np
+except ImportError:
+    np = None # optional, used to vectorize operations on all the nodes
 
 def get_popup_bg(message):
     """Creates the base for a popup. Returns the created background from a message string."""
@@ -158,7 +168,35 @@ def ask_button(message, buttons):
     screen.blit(old_screen, (0, 0))
     return res
 
+def show_progress(message, thread, progress):
+    """Displays a progress bar until a thread is done, the window still responds meanwhile.
+    Param message: message to be displayed above the progress bar
+    Param progress: function returning the progress, from 0 to 1"""
+
+    old_screen, background = get_popup_bg(message)
+
+    quit = False
+    while thread.is_alive():
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                quit = True # handled once the thread is done
+            elif event.type == VIDEORESIZE:
+                graph.resize()
+
+        screen.blit(background, (0, 0))
+        x, y, w, h = Graph.W*0.25, Graph.H/2, Graph.W*0.5, 20
+        pygame.draw.rect(screen, Palette.neutral, Rect(x, y, w, h))
+        pygame.draw.rect(screen, Palette.text, Rect(x, y, w*min(max(progress(), 0), 1), h))
+
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    screen.blit(old_screen, (0, 0))
+    if quit: pygame.event.post(pygame.event.Event(QUIT))
+
 def import_image():
+    from tkinter.filedialog import askopenfilename # only needed by the editor
+
     files = askopenfilename(title='Import image(s)', filetypes=(('Image files', ('png', 'jpg', 'bmp', 'gif')),), multiple=True)
     pygame.event.get()
 
@@ -173,6 +211,7 @@ def import_image():
 def ask_filename(new=False):
     """Triggers a filedialog to select a save file, and returns the file.
     If new is set to True, the function will be used for choosing a new file name."""
+    from tkinter.filedialog import askopenfilename, asksaveasfilename # only needed by the editor
 
     filetype = (('Progression Graph File', '.graph'),)
 
@@ -313,23 +352,48 @@ class Button:
         return res
 
 class Error:
-    """Static class, used to make handling exceptions easier"""
+    """Static class, used to make handling exceptions easier.
+    While a file is opened, the errors are gathered and then shown in a single popup, see Error.flush."""
+
+    collected = None # messages of the errors found while opening a file, None otherwise
+    max_shown = 3 # maximum number of gathered errors shown in the popup
+    popups = True # show the errors in popups, otherwise they are printed, when running without a display
+
+    @staticmethod
+    def popup(message):
+        if Error.popups: ask_button(message, [(0, 'OK')])
+        else: print(message, file=sys.stderr)
+
+    @staticmethod
+    def show(message):
+        """Shows an error message in a popup, or gathers it while a file is opened"""
+        if Error.collected is not None: Error.collected.append(message)
+        else: Error.popup(message)
+
+    @staticmethod
+    def flush():
+        """Shows the gathered errors in a single popup, and stops gathering them"""
+        messages, Error.collected = Error.collected, None
+        if not messages: return
+        if len(messages) > Error.max_shown:
+            messages = messages[:Error.max_shown] + ['...and %d more errors' %(len(messages)-Error.max_shown)]
+        Error.popup('\n'.join(messages))
 
     @staticmethod
     def syntax(y, expression):
         """Used to help handling file parsing errors"""
-        ask_button('Could not parse save file at line %d:\n"%s"\nAborting file loading' %(y+1, expression), [(0, 'OK')])
+        Error.show('Could not parse save file at line %d:\n"%s"\nAborting file loading' %(y+1, expression))
 
     @staticmethod
     def corrupted_file(comment, success):
         """Used when a non-critical file parsing error has been found. This doesn't interrupt file loading."""
         load_text = 'The file will still be loaded, check for side-effects.' if success else ''
-        ask_button('Detected save file corruption:\n"%s"\n%s' %(comment, load_text), [(0, 'OK')])
+        Error.show('Detected save file corruption:\n"%s"\n%s' %(comment, load_text))
 
     @staticmethod
     def zipfile(error):
         """Used when an error occurs while loading the save zip file"""
-        ask_button('Error while parsing for files in the save file:\n"%s"\nAborting file loading' %error, [(0, 'OK')])
+        Error.show('Error while parsing for files in the save file:\n"%s"\nAborting file loading' %error)
 
 class Palette:
     """Static class, used to store colors data"""
@@ -385,6 +449,563 @@ class Palette:
 
 Palette.__init__()
 
+class SurfaceCache:
+    """Static class, process-wide LRU cache of the node surfaces at the displayed sizes.
+    Nodes that look the same share the same surfaces, which are only scaled when first displayed at a new size."""
+
+    budget = 64 * 1024*1024 # maximum memory taken by the cached surfaces, in bytes
+
+    # key: (rank size, state, image, hover variant, displayed size), value: surface
+    surfs = OrderedDict()
+    used = 0 # memory currently taken by the cached surfaces, in bytes
+
+    @staticmethod
+    def get(size, state, image, i, s):
+        """Returns the surface of a node of size size, state state, with image image (can be None), for the
+        hover variant i (normal, hovered, selected), displayed at s pixels wide.
+        The zoom is quantized by s: all zoom levels giving the same displayed size share the same surfaces."""
+
+        key = (size, state, image, i, s)
+        surf = SurfaceCache.surfs.get(key)
+        if surf is not None:
+            SurfaceCache.surfs.move_to_end(key)
+            return surf
+
+        if s == size:
+            surf = Node.make_surf(size, state, image, i)
+        else:
+            surf = pygame.transform.smoothscale(SurfaceCache.get(size, state, image, i, size), (s, s))
+
+        SurfaceCache.surfs[key] = surf
+        SurfaceCache.used += SurfaceCache.surf_bytes(surf)
+        SurfaceCache.evict()
+        return surf
+
+    @staticmethod
+    def surf_bytes(surf):
+        w, h = surf.get_size()
+        return w * h * surf.get_bytesize()
+
+    @staticmethod
+    def evict():
+        """Removes the least recently used surfaces until the cache fits in the memory budget.
+        The most recent surface is always kept, even if it is bigger than the budget."""
+        while SurfaceCache.used > SurfaceCache.budget and len(SurfaceCache.surfs) > 1:
+            key, surf = SurfaceCache.surfs.popitem(last=False)
+            SurfaceCache.used -= SurfaceCache.surf_bytes(surf)
+
+    @staticmethod
+    def set_budget(budget):
+        """Sets the memory budget, in bytes, and evicts surfaces if needed"""
+        SurfaceCache.budget = budget
+        SurfaceCache.evict()
+
+    @staticmethod
+    def clear():
+        SurfaceCache.surfs.clear()
+        SurfaceCache.used = 0
+
+class SpatialGrid:
+    """Uniform grid over graph coordinates, used to quickly find the objects inside a rectangle.
+    Nodes are stored in the cell containing their center, links in every cell their segment crosses,
+    and also by the cell their segment starts in, so that large rectangles do not gather each link many times.
+    The nodes and the link starts are also grouped by blocks of cells, read at once inside large rectangles.
+    With NumPy, the end points of the links are also kept in arrays, to clip all of them at once when a rectangle
+    covers a large part of the graph: merging the cells would then take longer than a frame for large graphs."""
+
+    cell_size = 2 # in graph units
+    block_size = 8 # in cells
+    clip_all_ratio = 1/16 # minimum part of the grid bounds covered by a rectangle to clip all the links, with NumPy
+
+    def __init__(self):
+        self.cells = {} # key: (cx, cy), value: [set of nodes, set of links], empty cells are removed
+        self.node_cells = {} # node: cell key
+        self.link_cells = {} # link: list of cell keys
+        self.link_starts = {} # key: (cx, cy), value: set of the links whose segment starts in this cell
+        self.blocks = {} # key: (bx, by), value: [set of nodes, set of link starts] of the cells in the block
+        self.bounds = None # [cx0, cy0, cx1, cy1], contains all the non-empty cells, only grows
+
+        # with NumPy, end points of the links, by slot
+        self.ends = None if np is None else np.zeros((4, 64)) # rows x1, y1, x2, y2
+        self.slot_links = None if np is None else np.full(64, None, object) # link in each slot, None for free slots
+        self.link_slots = {} # link: slot
+        self.free_slots = []
+        self.count = 0 # slots above this one have never been used
+
+    def cell(self, x, y):
+        """Returns the key of the cell containing the position (x, y)"""
+        return floor(x/self.cell_size), floor(y/self.cell_size)
+
+    def segment_cells(self, x1, y1, x2, y2):
+        """Returns the list of the keys of the cells crossed by the segment between (x1, y1) and (x2, y2).
+        Walks the grid cell by cell, going each time through the closest cell border along the segment."""
+
+        cs = self.cell_size
+        cx, cy = floor(x1/cs), floor(y1/cs)
+        ex, ey = floor(x2/cs), floor(y2/cs)
+        cells = [(cx, cy)]
+        if cx == ex and cy == ey: return cells
+
+        # t: position along the segment, from 0 to 1, of the next vertical and horizontal cell borders
+        dx, dy = x2-x1, y2-y1
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        if dx:
+            t_x = ((cx + (dx > 0))*cs - x1) / dx
+            dt_x = cs/abs(dx)
+        else: t_x = dt_x = inf
+        if dy:
+            t_y = ((cy + (dy > 0))*cs - y1) / dy
+            dt_y = cs/abs(dy)
+        else: t_y = dt_y = inf
+
+        # the number of steps is known, which protects against floating point errors
+        for _ in range(abs(ex-cx) + abs(ey-cy)):
+            if cy == ey or (cx != ex and t_x < t_y):
+                cx += step_x
+                t_x += dt_x
+            else:
+                cy += step_y
+                t_y += dt_y
+            cells.append((cx, cy))
+
+        return cells
+
+    def block(self, key):
+        """Returns the entry of the block containing the cell key, creating it if needed"""
+        bkey = key[0]//self.block_size, key[1]//self.block_size
+        block = self.blocks.get(bkey)
+        if block is None: block = self.blocks[bkey] = [set(), set()]
+        return block
+
+    def _unblock(self, key, obj, i):
+        bkey = key[0]//self.block_size, key[1]//self.block_size
+        block = self.blocks[bkey]
+        block[i].discard(obj)
+        if not block[0] and not block[1]: del self.blocks[bkey]
+
+    def _add(self, key, obj, i):
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = [set(), set()]
+
+            cx, cy = key
+            b = self.bounds
+            if b is None: self.bounds = [cx, cy, cx, cy]
+            else:
+                if cx < b[0]: b[0] = cx
+                elif cx > b[2]: b[2] = cx
+                if cy < b[1]: b[1] = cy
+                elif cy > b[3]: b[3] = cy
+        cell[i].add(obj)
+
+    def _remove(self, key, obj, i):
+        cell = self.cells[key]
+        cell[i].discard(obj)
+        if not cell[0] and not cell[1]: del self.cells[key]
+
+    def add_node(self, node):
+        key = self.cell(node.x, node.y)
+        self.node_cells[node] = key
+        self._add(key, node, 0)
+        self.block(key)[0].add(node)
+
+    def remove_node(self, node):
+        key = self.node_cells.pop(node, None)
+        if key is None: return
+        self._remove(key, node, 0)
+        self._unblock(key, node, 0)
+
+    def move_node(self, node):
+        """Updates the cell of a node after its position changed"""
+        key = self.cell(node.x, node.y)
+        if self.node_cells.get(node) != key:
+            self.remove_node(node)
+            self.add_node(node)
+
+    def add_link(self, link):
+        """Adds a link to the grid, links that are still being created (n2 is None) are ignored"""
+        if link.n2 is None: return
+
+        keys = self.segment_cells(link.n1.x, link.n1.y, link.n2.x, link.n2.y)
+        self.link_cells[link] = keys
+        self.link_starts.setdefault(keys[0], set()).add(link)
+        self.block(keys[0])[1].add(link)
+        for key in keys: self._add(key, link, 1)
+        if self.ends is not None: self.add_ends(link, (link.n1.x, link.n1.y, link.n2.x, link.n2.y))
+
+    def add_links(self, links, ends):
+        """Adds many links to the grid at once, like add_link, ends being the list of their (x1, y1, x2, y2) end points"""
+        cells, link_cells, link_starts = self.cells, self.link_cells, self.link_starts
+        for link, (x1, y1, x2, y2) in zip(links, ends):
+            keys = link_cells[link] = self.segment_cells(x1, y1, x2, y2)
+            link_starts.setdefault(keys[0], set()).add(link)
+            self.block(keys[0])[1].add(link)
+            for key in keys:
+                cell = cells.get(key)
+                if cell is None: self._add(key, link, 1)
+                else: cell[1].add(link)
+            if self.ends is not None: self.add_ends(link, (x1, y1, x2, y2))
+
+    def add_ends(self, link, ends):
+        """Stores the end points (x1, y1, x2, y2) of a link in a free slot of the arrays"""
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.count
+            if slot == len(self.slot_links):
+                # double the capacity
+                self.ends = np.concatenate((self.ends, np.zeros_like(self.ends)), 1)
+                self.slot_links = np.concatenate((self.slot_links, np.full(slot, None, object)))
+            self.count += 1
+        self.link_slots[link] = slot
+        self.slot_links[slot] = link
+        self.ends[:, slot] = ends
+
+    def remove_link(self, link):
+        keys = self.link_cells.pop(link, None)
+        if keys is None: return
+        starts = self.link_starts[keys[0]]
+        starts.discard(link)
+        if not starts: del self.link_starts[keys[0]]
+        self._unblock(keys[0], link, 1)
+        if self.ends is not None:
+            slot = self.link_slots.pop(link)
+            self.slot_links[slot] = None
+            self.free_slots.append(slot)
+        for key in keys: self._remove(key, link, 1)
+
+    def update_link(self, link):
+        """Updates the cells of a link after one of its nodes moved"""
+        self.remove_link(link)
+        self.add_link(link)
+
+    @staticmethod
+    def segment_in_rect(x1, y1, x2, y2, rect):
+        """Returns True if the segment between (x1, y1) and (x2, y2) touches rect = (x0, y0, x1, y1).
+        Liang-Barsky clipping: the part of the segment inside the rectangle is [t0, t1], in the segment's
+        parametric form, which gets clipped by each side of the rectangle. It is empty when t0 > t1."""
+
+        rx0, ry0, rx1, ry1 = rect
+        dx, dy = x2-x1, y2-y1
+        t0, t1 = 0, 1
+        for p, q in ((-dx, x1-rx0), (dx, rx1-x1), (-dy, y1-ry0), (dy, ry1-y1)):
+            if p == 0:
+                # parallel to this side, and outside of it
+                if q < 0: return False
+            else:
+                t = q/p
+                if p < 0:
+                    if t > t1: return False
+                    if t > t0: t0 = t
+                else:
+                    if t < t0: return False
+                    if t < t1: t1 = t
+        return True
+
+    def links_in_rect(self, rect):
+        """Returns the set of the links whose segment touches rect, by clipping all of them at once with NumPy.
+        Same test as segment_in_rect, for each axis: the segment is inside the two sides of rect for t between
+        the values where it crosses them, so it touches rect if the largest of the lower values and 0 is not above
+        the smallest of the upper values and 1. Parallel to an axis, these values are infinite, of the same sign
+        when outside, and NaN exactly on a side, which is ignored by fmax and fmin."""
+
+        n = self.count
+        x1, y1, x2, y2 = self.ends[:, :n]
+        rx0, ry0, rx1, ry1 = rect
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dx, dy = x2-x1, y2-y1
+            ax, bx = (rx0-x1)/dx, (rx1-x1)/dx
+            ay, by = (ry0-y1)/dy, (ry1-y1)/dy
+            t0 = np.fmax(np.fmax(np.minimum(ax, bx), np.minimum(ay, by)), 0)
+            t1 = np.fmin(np.fmin(np.maximum(ax, bx), np.maximum(ay, by)), 1)
+        links = set(self.slot_links[:n][t0 <= t1])
+        links.discard(None) # free slots
+        return links
+
+    def cells_in(self, cx0, cy0, cx1, cy1, cells=None):
+        """Returns the list of the (key, cell) pairs of the non-empty cells between cells (cx0, cy0) and (cx1, cy1).
+        Param cells: dict of the cells to look into, self.cells by default, or self.blocks with block keys"""
+        if cells is None: cells = self.cells
+        if cx1 < cx0 or cy1 < cy0: return []
+        if (cx1-cx0+1) * (cy1-cy0+1) > len(cells):
+            # zoomed out: there are less non-empty cells than cells in the rectangle, iterate on the former
+            return [(key, cell) for key, cell in cells.items() if cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1]
+
+        found = []
+        for cx in range(cx0, cx1+1):
+            for cy in range(cy0, cy1+1):
+                cell = cells.get((cx, cy))
+                if cell is not None: found.append(((cx, cy), cell))
+        return found
+
+    def query(self, rect, link_rect=None, get_nodes=True):
+        """Returns the sets of nodes and links in the rectangle rect = (x0, y0, x1, y1).
+        The nodes are the ones stored in the cells overlapping rect, so some can be slightly outside of it
+        and should be checked separately. If get_nodes is False, the returned set of nodes is empty.
+        The links are exactly the ones whose segment touches link_rect, which defaults to rect and should be inside it:
+        links crossing a cell that is fully inside link_rect are kept right away, the others are clipped.
+        Deeper inside, the links crossing a cell also cross the cells around it up to their start, so only the links
+        starting in the cell are gathered: long links would otherwise be added once for each cell they cross.
+        The blocks that are fully in this deeper part are read as a whole, the cells around them one by one.
+        With NumPy, when link_rect covers a large part of the grid, all the links are clipped instead, see links_in_rect."""
+
+        if link_rect is None: link_rect = rect
+        cx0, cy0 = self.cell(*rect[:2])
+        cx1, cy1 = self.cell(*rect[2:])
+        lx0, ly0 = self.cell(*link_rect[:2])
+        lx1, ly1 = self.cell(*link_rect[2:])
+
+        b = self.bounds
+        if b is not None and lx0 < b[0] and ly0 < b[1] and b[2] < lx1 and b[3] < ly1:
+            # zoomed out, all the cells are inside link_rect: every object is returned
+            return set(self.node_cells) if get_nodes else set(), set(self.link_cells)
+
+        nodes, links = set(), set()
+        clip_all = self.ends is not None and b is not None and \
+                   (lx1-lx0+1) * (ly1-ly0+1) > (b[2]-b[0]+1) * (b[3]-b[1]+1) * SpatialGrid.clip_all_ratio
+        if clip_all:
+            links = self.links_in_rect(link_rect)
+            if not get_nodes: return nodes, links
+
+        # blocks inside the deeper cells, from (lx0+2, ly0+2) to (lx1-2, ly1-2)
+        bs = self.block_size
+        bx0, by0 = -((-lx0-2)//bs), -((-ly0-2)//bs)
+        bx1, by1 = (lx1-1)//bs - 1, (ly1-1)//bs - 1
+        if bx0 <= bx1 and by0 <= by1:
+            for key, block in self.cells_in(bx0, by0, bx1, by1, self.blocks):
+                if get_nodes: nodes.update(block[0])
+                if not clip_all: links.update(block[1])
+            # the cells around the blocks: above, below, left and right of them
+            ix0, iy0, ix1, iy1 = bx0*bs, by0*bs, (bx1+1)*bs - 1, (by1+1)*bs - 1
+            cells = (self.cells_in(cx0, cy0, cx1, iy0-1) + self.cells_in(cx0, iy1+1, cx1, cy1)
+                     + self.cells_in(cx0, iy0, ix0-1, iy1) + self.cells_in(ix1+1, iy0, cx1, iy1))
+        else: cells = self.cells_in(cx0, cy0, cx1, cy1)
+
+        if clip_all:
+            for key, cell in cells: nodes.update(cell[0])
+            return nodes, links
+
+        border_links = set() # links that are only in cells on the border of link_rect, to clip
+        link_starts = self.link_starts
+        for key, cell in cells:
+            if get_nodes: nodes.update(cell[0])
+            if lx0+1 < key[0] < lx1-1 and ly0+1 < key[1] < ly1-1:
+                starts = link_starts.get(key)
+                if starts is not None: links.update(starts)
+            elif lx0 < key[0] < lx1 and ly0 < key[1] < ly1: links.update(cell[1])
+            else: border_links.update(cell[1])
+
+        for link in border_links - links:
+            if self.segment_in_rect(link.n1.x, link.n1.y, link.n2.x, link.n2.y, link_rect):
+                links.add(link)
+
+        return nodes, links
+
+    def nodes_in_rect(self, x0, y0, x1, y1):
+        """Returns the list of nodes whose center is in the rectangle (x0, y0, x1, y1)"""
+        nodes = []
+        for key, cell in self.cells_in(*self.cell(x0, y0), *self.cell(x1, y1)):
+            for node in cell[0]:
+                if x0 <= node.x <= x1 and y0 <= node.y <= y1:
+                    nodes.append(node)
+        return nodes
+
+    def node_at(self, x, y, scale):
+        """Returns the topmost node, in the display order, that contains the position (x, y), or None.
+        Param scale: ratio between the nodes size, in pixels, and graph units"""
+
+        r = Node.rank_sizes[-1]/2 * scale # biggest possible distance from a hit node center
+        cx0, cy0 = self.cell(x-r, y-r)
+        cx1, cy1 = self.cell(x+r, y+r)
+
+        result = None
+        for key, cell in self.cells_in(cx0, cy0, cx1, cy1):
+            for node in cell[0]:
+                s = node.size/2 * scale
+                if node.x-s < x < node.x+s and node.y-s < y < node.y+s:
+                    if result is None or Node.draw_order(node) > Node.draw_order(result):
+                        result = node
+
+        return result
+
+    def link_at(self, x, y, scale):
+        """Returns the link closest to the position (x, y) within its size tolerance, or None.
+        Param scale: ratio between the links size, in pixels, and graph units"""
+
+        r = Link.rank_sizes[-1] * scale # biggest possible tolerance
+        cx0, cy0 = self.cell(x-r, y-r)
+        cx1, cy1 = self.cell(x+r, y+r)
+
+        result = None
+        best = inf
+        for key, cell in self.cells_in(cx0, cy0, cx1, cy1):
+            for link in cell[1]:
+                d2 = link.distance2(x, y)
+                s = link.size * scale
+                if d2 <= s*s and d2 < best:
+                    result = link
+                    best = d2
+
+        return result
+
+class DrawOrder:
+    """Display order of the nodes: they are grouped in buckets by rank, displayed from the lowest rank to the highest,
+    and in order of insertion inside of a rank. Adding, removing and changing the rank of a node is O(1)."""
+
+    def __init__(self):
+        self.buckets = {} # key: rank, value: dict of nodes, used as an ordered set
+        self.keys = {} # key: node, value: (rank, insertion number), sorting key following the display order
+        self.count = 0 # insertion counter
+
+    def add(self, node):
+        """Adds a node on top of the other nodes of its rank"""
+        bucket = self.buckets.get(node.rank)
+        if bucket is None: bucket = self.buckets[node.rank] = {}
+        bucket[node] = None
+        self.keys[node] = (node.rank, self.count)
+        node.order = self.count # also kept in the node for NodeStore.visible
+        self.count += 1
+
+    def remove(self, node):
+        rank = self.keys.pop(node)[0]
+        del self.buckets[rank][node]
+
+    def update(self, node):
+        """Moves a node to its new rank bucket after its rank changed"""
+        if node in self.keys:
+            self.remove(node)
+            self.add(node)
+
+    def key(self, node):
+        """Returns a sorting key for a node, following the display order"""
+        return self.keys[node]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        """Iterates over the nodes in display order"""
+        for rank in sorted(self.buckets):
+            yield from self.buckets[rank]
+
+class NodeStore:
+    """Struct-of-arrays storage of the nodes attributes, in NumPy arrays. Only used when NumPy is installed:
+    the Node objects are then views onto their slot in the store, and operations on all the nodes are vectorized."""
+
+    # stored node attributes and their types
+    fields = {'x': float, 'y': float, 'rank': int, 'state': int, 'size': int, 'order': int}
+
+    def __init__(self, capacity=64):
+        for name, dtype in NodeStore.fields.items():
+            setattr(self, name, np.zeros(capacity, dtype))
+        self.alive = np.zeros(capacity, bool) # False for free slots
+        self.nodes = [None]*capacity # node object for each slot
+
+        self.free_slots = []
+        self.count = 0 # slots above this one have never been used
+
+    @staticmethod
+    def view(name):
+        """Returns a property reading and writing the field name of a node in its store"""
+        def get(node): return getattr(node.store, name).item(node.slot)
+        def set(node, value): getattr(node.store, name)[node.slot] = value
+        return property(get, set)
+
+    def add(self, node):
+        """Gives a slot to a node, and returns it"""
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.count
+            if slot == len(self.alive): self.reserve(1)
+            self.count += 1
+
+        self.alive[slot] = True
+        self.nodes[slot] = node
+        return slot
+
+    def reserve(self, n):
+        """Makes room for n more nodes, by doubling the capacity of all arrays as many times as needed"""
+        capacity = len(self.alive)
+        new_capacity = capacity
+        while new_capacity < self.count + n: new_capacity *= 2
+        if new_capacity == capacity: return
+
+        for name in (*NodeStore.fields, 'alive'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.zeros(new_capacity-capacity, array.dtype))))
+        self.nodes += [None]*(new_capacity-capacity)
+
+    def remove(self, slot):
+        self.alive[slot] = False
+        self.nodes[slot] = None
+        self.free_slots.append(slot)
+
+    def project(self, graph):
+        """Returns the arrays of the screen coordinates of the nodes in all the used slots, same as Graph.project"""
+        n = self.count
+        z = graph.zoom * Graph.unit_size
+        return (self.x[:n] - graph.scroll_x) * z + Graph.W/2, (self.y[:n] - graph.scroll_y) * z + Graph.H/2
+
+    def visible(self, graph):
+        """Returns the list of visible nodes in display order, same test as Node.visible"""
+        n = self.count
+        x, y = self.project(graph)
+        s = self.size[:n]/2
+        slots = np.flatnonzero(self.alive[:n] & (-s <= x) & (x < Graph.W+s) & (-s <= y) & (y < Graph.H+s))
+
+        # sort by rank, then by insertion order, like DrawOrder
+        slots = slots[np.lexsort((self.order[slots], self.rank[slots]))]
+        nodes = self.nodes
+        return [nodes[slot] for slot in slots.tolist()]
+
+    def density(self, graph, cell):
+        """Returns the visible nodes aggregated into square screen cells of size cell, as a dict
+        key: (cx, cy) cell position, value: number of nodes in the cell for each state"""
+        n = self.count
+        x, y = self.project(graph)
+        mask = self.alive[:n] & (0 <= x) & (x < Graph.W) & (0 <= y) & (y < Graph.H)
+
+        w = int(Graph.W//cell) + 1
+        h = int(Graph.H//cell) + 1
+        index = (y[mask]//cell).astype(int) * w + (x[mask]//cell).astype(int)
+        # one count per cell and state, whatever the state of the node in the last cell
+        counts = np.bincount(index*3 + self.state[:n][mask], minlength=3*w*h).reshape(-1, 3)
+
+        indices = np.flatnonzero(counts.any(axis=1))
+        return {(i%w, i//w): c for i, c in zip(indices.tolist(), counts[indices].tolist())}
+
+    def in_rect(self, x0, y0, x1, y1):
+        """Returns the list of nodes whose center is in the rectangle (x0, y0, x1, y1), in graph coordinates"""
+        n = self.count
+        x, y = self.x[:n], self.y[:n]
+        slots = np.flatnonzero(self.alive[:n] & (x0 <= x) & (x <= x1) & (y0 <= y) & (y <= y1))
+        nodes = self.nodes
+        return [nodes[slot] for slot in slots.tolist()]
+
+class IdAllocator:
+    """Gives the smallest free ID of a kind of objects. Freed IDs are kept in a heap, and IDs from next_id upwards
+    are free unless they were used explicitly (e.g. from a save file), which makes allocating amortized O(1)."""
+
+    def __init__(self, objects):
+        self.objects = objects # dict of the objects of this kind, key: ID
+        self.free_ids = [] # heap of freed IDs, some can have been used again explicitly since then
+        self.next_id = 0 # IDs below this one are either used or in self.free_ids
+
+    def allocate(self):
+        """Returns the smallest free ID"""
+        while self.free_ids:
+            id = heappop(self.free_ids)
+            if id not in self.objects: return id
+
+        while self.next_id in self.objects: self.next_id += 1
+        return self.next_id
+
+    def free(self, id):
+        """Marks an ID as free again, should be called after removing the corresponding object"""
+        if id < self.next_id: heappush(self.free_ids, id)
+
 class Manager:
     """Manager for all objects. Should be used to create and remove new objects, as it manages the ID system."""
 
@@ -393,39 +1014,196 @@ class Manager:
     links = {}
     images = {}
 
+    # ID allocators for the nodes, links and images
+    node_ids = IdAllocator(nodes)
+    link_ids = IdAllocator(links)
+    image_ids = IdAllocator(images)
+    image_keys = {} # key: image key (see Image.pixels_key), value: image, to share the images with the same pixels
+
+    grid = SpatialGrid() # spatial index of nodes and links, to quickly get the visible ones
+    draw_order = DrawOrder() # nodes in display order, the more important ones on top
+    store = None if np is None else NodeStore() # nodes attributes arrays, if NumPy is available
+
+    # adjacency index, to avoid looking through all the links
+    node_links = {} # key: node, value: set of links attached to it, including the link being created
+    link_pairs = {} # key: Manager.pair(n1, n2), value: link between these nodes
+
+    removed = 0 # number of nodes and links removed, they move the next ones back in the dictionaries (see Autosave.walk)
+
     @staticmethod
-    def new_obj(args, _class, _dict, id):
-        """Adds a new object to the corresponding dictionary, assigns an ID if needed"""
-        if id is None:
-            id = 0 # get the first available ID, starting at 0
-            while id in _dict: id += 1
+    def new_obj(args, _class, _dict, ids, id):
+        """Adds a new object to the corresponding dictionary, assigns an ID from the allocator ids if needed.
+        Raises ValueError if the ID is already used, the object would otherwise stay in the indexes."""
+        if id is None: id = ids.allocate() # get the first available ID, starting at 0
         else: id = int(id)
+        if id in _dict: raise ValueError('ID %d already used' %id)
 
         _dict[id] = _class(*args, id)
         return _dict[id]
 
     @staticmethod
     def new_node(x, y, rank, state, id=None):
-        result = Manager.new_obj((float(x), float(y), int(rank), int(state)), Node, Manager.nodes, id)
-
-        # sort nodes to display the more important ones on top
-        keys = sorted(Manager.nodes.keys(), key=lambda key: Manager.nodes[key].rank)
-        copy = dict(Manager.nodes)
-        Manager.nodes = {}
-        for key in keys:
-            Manager.nodes[key] = copy[key]
-
+        result = Manager.new_obj((float(x), float(y), int(rank), int(state)), Node, Manager.nodes, Manager.node_ids, id)
+        Manager.draw_order.add(result)
+        Manager.grid.add_node(result)
         return result
 
     @staticmethod
     def new_link(n1, n2, id=None):
         n1 = Manager.nodes[int(n1)]
         n2 = None if n2 is None else Manager.nodes[int(n2)]
-        return Manager.new_obj((n1, n2), Link, Manager.links, id)
+        result = Manager.new_obj((n1, n2), Link, Manager.links, Manager.link_ids, id)
+        Manager.index_link(result)
+        return result
+
+    @staticmethod
+    def new_nodes(rows):
+        """Adds nodes in bulk when loading a file, each row being the (x, y, rank, state, id) arguments of new_node.
+        Returns the indices of the rows with wrong values or an ID already used, which are skipped."""
+        failed = []
+        if Manager.store is not None: Manager.store.reserve(len(rows))
+        nodes, draw_order, grid = Manager.nodes, Manager.draw_order, Manager.grid
+        for i, (x, y, rank, state, id) in enumerate(rows):
+            try:
+                if int(id) in nodes: raise ValueError('ID %d already used' %int(id))
+                node = Node(float(x), float(y), int(rank), int(state), int(id))
+            except ValueError:
+                failed.append(i)
+                continue
+            nodes[node.id] = node
+            draw_order.add(node)
+            grid.add_node(node)
+        return failed
+
+    @staticmethod
+    def new_links(rows):
+        """Adds links in bulk when loading a file, each row being the (n1, n2, id) arguments of new_link.
+        Returns the indices of the rows with wrong values or an ID already used, which are skipped."""
+        failed, added = [], []
+        nodes, links, node_links, link_pairs = Manager.nodes, Manager.links, Manager.node_links, Manager.link_pairs
+        for i, (n1, n2, id) in enumerate(rows):
+            try:
+                if int(id) in links: raise ValueError('ID %d already used' %int(id))
+                link = Link(nodes[int(n1)], nodes[int(n2)], int(id))
+            except (ValueError, KeyError):
+                failed.append(i)
+                continue
+            links[link.id] = link
+            added.append(link)
+
+            # same as Manager.index_link, the spatial index is updated afterwards
+            n1, n2 = link.n1, link.n2
+            for node in (n1, n2):
+                attached = node_links.get(node)
+                if attached is None: node_links[node] = {link}
+                else: attached.add(link)
+            link_pairs[(n1.id, n2.id) if n1.id < n2.id else (n2.id, n1.id)] = link
+
+        # with NumPy, the end points are read from the store arrays at once
+        store = Manager.store
+        if store is not None:
+            slots1 = np.fromiter(map(attrgetter('n1.slot'), added), np.intp, len(added))
+            slots2 = np.fromiter(map(attrgetter('n2.slot'), added), np.intp, len(added))
+            ends = np.stack((store.x[slots1], store.y[slots1], store.x[slots2], store.y[slots2]), 1).tolist()
+        else: ends = [(link.n1.x, link.n1.y, link.n2.x, link.n2.y) for link in added]
+        Manager.grid.add_links(added, ends)
+        return failed
 
     @staticmethod
-    def new_image(name, content, id=None):
-        return Manager.new_obj((name, content), Image, Manager.images, id)
+    def pair(n1, n2):
+        """Returns the key of the pair of nodes (n1, n2) in Manager.link_pairs, the order of the nodes doesn't matter"""
+        return (n1.id, n2.id) if n1.id < n2.id else (n2.id, n1.id)
+
+    @staticmethod
+    def get_link(n1, n2):
+        """Returns the link between the nodes n1 and n2, or None"""
+        return Manager.link_pairs.get(Manager.pair(n1, n2))
+
+    @staticmethod
+    def index_link(link):
+        """Adds a link to the adjacency and spatial indexes"""
+        for node in (link.n1, link.n2):
+            if node is not None: Manager.node_links.setdefault(node, set()).add(link)
+        if link.n2 is not None: Manager.link_pairs[Manager.pair(link.n1, link.n2)] = link
+        Manager.grid.add_link(link)
+
+    @staticmethod
+    def finish_link(link, n2):
+        """Attaches the end node of a link that was being created"""
+        link.n2 = n2
+        link.refresh()
+        Manager.index_link(link)
+
+    @staticmethod
+    def new_image(name, content, id=None, source=None):
+        """Adds an image, and returns it. If an image with the same pixels already exists, it is returned instead.
+        The pixels of lazy images are only compared when their key is known without decoding them."""
+        image = Manager.new_obj((name, content, source), Image, Manager.images, Manager.image_ids, id)
+        if image.key is None: return image
+
+        same = Manager.image_keys.get(image.key)
+        if same is None:
+            Manager.image_keys[image.key] = image
+            return image
+
+        del Manager.images[image.id]
+        Manager.image_ids.free(image.id)
+        return same
+
+    @staticmethod
+    def delete_node(node):
+        """Removes a node and the links attached to it"""
+        for link in list(Manager.node_links.get(node, ())):
+            Manager.delete_link(link)
+        Manager.node_links.pop(node, None)
+
+        del Manager.nodes[node.id]
+        Manager.removed += 1
+        Manager.node_ids.free(node.id)
+        if node.store is not None: node.store.remove(node.slot)
+        Manager.draw_order.remove(node)
+        Manager.grid.remove_node(node)
+
+    @staticmethod
+    def delete_link(link):
+        del Manager.links[link.id]
+        Manager.removed += 1
+        Manager.link_ids.free(link.id)
+        for node in (link.n1, link.n2):
+            if node is not None: Manager.node_links[node].discard(link)
+        if link.n2 is not None: Manager.link_pairs.pop(Manager.pair(link.n1, link.n2), None)
+        Manager.grid.remove_link(link)
+
+    @staticmethod
+    def move_node(node, x, y):
+        """Moves a node and updates its position in the spatial index.
+        Links attached to it should be updated with Manager.grid.update_link afterwards."""
+        node.x = x
+        node.y = y
+        Manager.grid.move_node(node)
+
+    @staticmethod
+    def set_node(x, y, rank, state, id):
+        """Creates a node, or updates the node with the same ID, used when replaying a journal"""
+        node = Manager.nodes.get(int(id))
+        if node is None: return Manager.new_node(x, y, rank, state, id)
+
+        x, y, rank, state = float(x), float(y), int(rank), int(state)
+        if (x, y) != (node.x, node.y):
+            Manager.move_node(node, x, y)
+            for link in Manager.node_links.get(node, ()): Manager.grid.update_link(link)
+        if rank != node.rank: node.set_rank(rank)
+        if state != node.state: node.set_state(state)
+        return node
+
+    @staticmethod
+    def set_link(n1, n2, id):
+        """Creates a link, or replaces the link with the same ID if it connects other nodes, used when replaying a journal"""
+        link = Manager.links.get(int(id))
+        if link is not None:
+            if link.n1.id == int(n1) and link.n2 is not None and link.n2.id == int(n2): return link
+            Manager.delete_link(link)
+        return Manager.new_link(n1, n2, id)
 
     @staticmethod
     def attach_image(node_id, image_id):
@@ -442,8 +1220,36 @@ class Manager:
         Manager.nodes = {}
         Manager.links = {}
         Manager.images = {}
+        Manager.node_ids = IdAllocator(Manager.nodes)
+        Manager.link_ids = IdAllocator(Manager.links)
+        Manager.image_ids = IdAllocator(Manager.images)
+        Manager.image_keys = {}
+        Manager.grid = SpatialGrid()
+        Manager.draw_order = DrawOrder()
+        Manager.store = None if np is None else NodeStore()
+        Manager.node_links = {}
+        Manager.link_pairs = {}
+        SurfaceCache.clear() # release the surfaces of the unloaded images
+        Image.clear()
+
+    @staticmethod
+    def backup():
+        """Returns the current state of the Manager, to be used with Manager.restore"""
+        return Manager.nodes, Manager.links, Manager.images, Manager.node_ids, Manager.link_ids, Manager.image_ids, \
+               Manager.image_keys, Manager.grid, Manager.draw_order, Manager.store, Manager.node_links, Manager.link_pairs
+
+    @staticmethod
+    def restore(backup):
+        """Restores the state of the Manager from Manager.backup. Should be used after Manager.reset."""
+        Manager.nodes, Manager.links, Manager.images, Manager.node_ids, Manager.link_ids, Manager.image_ids, \
+            Manager.image_keys, Manager.grid, Manager.draw_order, Manager.store, Manager.node_links, Manager.link_pairs = backup
+
+        for image in Manager.images.values():
+            if image.source is not None and image._surf is not None: Image.track(image)
 
 class GraphObject:
+    __slots__ = ()
+
     def update(self, events):
         raise NotImplementedError
 
@@ -452,11 +1258,18 @@ class GraphObject:
 
 class Node(GraphObject):
     """Node in the graph, can be attached to various links and have text and an image"""
+
+    # with NumPy, the attributes in NodeStore.fields are stored in Manager.store instead
+    __slots__ = ('store', 'slot', 'id', 'text', 'image', '_text_surfs') + (() if np is not None else tuple(NodeStore.fields))
     N_RANKS = 5
     rank_sizes = [40, 50, 60, 80, 100]
     assert len(rank_sizes) == N_RANKS
 
     def __init__(self, x, y, rank, state, id):
+        # with NumPy, the attributes below are stored in Manager.store (see NodeStore.view)
+        self.store = Manager.store
+        if self.store is not None: self.slot = self.store.add(self)
+
         self.x = x
         self.y = y
         self.state = state
@@ -465,16 +1278,9 @@ class Node(GraphObject):
         self.text = ''
         self.image = None # image, None for no image
 
-        # on init and when changing zoom, cache the scaled surfaces
-        self.cached_surfs = None
-        self.cached_zoom = None
+        self._text_surfs = None # rendered pygame fonts, see Node.text_surfs
 
-        # rendered pygame fonts, None for no text
-        # if text, will contain [shortened text, full text (on hover/selection)]
-        self.text_surfs = None
-        self.size = None # should contain the size according to self.rank
-
-        self.set_rank(rank) # init self.rank, self.size and self.surfs
+        self.set_rank(rank) # init self.rank and self.size
 
     @staticmethod
     def get_rank_size(rank):
@@ -482,27 +1288,33 @@ class Node(GraphObject):
         rank = min(max(rank, 0), Node.N_RANKS-1)
         return Node.rank_sizes[rank]
 
+    @staticmethod
+    def draw_order(node):
+        """Sorting key for displaying nodes, the more important ones are displayed last, on top of the others"""
+        return Manager.draw_order.key(node)
+
     def set_rank(self, rank):
         self.rank = rank
         self.size = Node.get_rank_size(rank)
-        self.set_image(self.image)
+        Manager.draw_order.update(self)
 
         # update attached links
-        for link in Manager.links.values():
-            if self == link.n1 or self == link.n2:
-                link.refresh()
+        for link in Manager.node_links.get(self, ()):
+            link.refresh()
 
     def cycle_rank(self):
         self.set_rank((self.rank+1) % Node.N_RANKS)
 
+    def set_state(self, state):
+        self.state = state
+
+        # update attached links
+        for link in Manager.node_links.get(self, ()):
+            link.refresh()
+
     def cycle_state(self):
         # order: todo, completed, doing
-        self.state = (self.state-1) % 3
-        self.set_image(self.image) # update self._surf
-
-        for link in Manager.links.values():
-            if self == link.n1 or self == link.n2:
-                link.refresh()
+        self.set_state((self.state-1) % 3)
 
     @staticmethod
     def black_back(surf):
@@ -518,69 +1330,80 @@ class Node(GraphObject):
         return new
 
     def set_text(self, text):
-        """Sets the node's text and updates its text Surface"""
+        """Sets the node's text, its text surfaces are rendered when first used"""
         self.text = text
-        if text == '':
-            self.text_surfs = None
-        else:
-            max_width = 100
-            if len(text)*char_w2 > max_width:
-                # make unselected surface: cut text
-                surf = font2.render(text[:int(max_width/char_w2)-3]+'...', True, Palette.text)
-                self.text_surfs = [Node.black_back(surf), None]
-
-                # make selected surface: word wrap if necessary
-                # get words and split them if bigger than max_width
-                words = []
-                for word in text.split(' '):
-                    while len(word)*char_w2 > max_width:
-                        i = int(max_width/char_w2)-1
-                        add, word = word[:i]+'-', word[i:]
-                        words.append(add)
-                    words.append(word)
-
-                lines = ['']
-                i = 0
-                for word in words:
-                    space = ' ' if lines[i] else ''
-                    if len(lines[i]+space+word) * char_w2 > max_width:
-                        if lines[i] == '':
-                            lines[i] += word
-                            lines.append('')
-                        else: lines.append(word)
-                        i += 1
-                    else:
-                        lines[i] += space+word
+        self._text_surfs = None
 
-                # assemble lines into one surface
-                width = len(max(lines, key=lambda l: len(l)))*char_w2
-                surf = pygame.Surface((width, 12*len(lines)), SRCALPHA)
-                for y, line in enumerate(lines):
-                    line = font2.render(line, True, Palette.text)
-                    surf.blit(line, (width/2 - line.get_width()/2, y*12))
+    @property
+    def text_surfs(self):
+        """Rendered text surfaces, None for no text: [shortened text, full text (on hover/selection)]"""
+        if self._text_surfs is None and self.text:
+            self._text_surfs = Node.render_text(self.text)
+        return self._text_surfs
 
-                self.text_surfs[1] = Node.black_back(surf)
-            else:
-                # same text for both unselected and selected
-                surf = Node.black_back(font2.render(text, True, Palette.text))
-                self.text_surfs = [surf, surf]
+    @staticmethod
+    def render_text(text):
+        """Returns the text surfaces of a node: [shortened text, full text], word wrapped to fit under the node"""
+        max_width = 100
+        if len(text)*char_w2 > max_width:
+            # make unselected surface: cut text
+            surf = font2.render(text[:int(max_width/char_w2)-3]+'...', True, Palette.text)
+            surfs = [Node.black_back(surf), None]
+
+            # make selected surface: word wrap if necessary
+            # get words and split them if bigger than max_width
+            words = []
+            for word in text.split(' '):
+                while len(word)*char_w2 > max_width:
+                    i = int(max_width/char_w2)-1
+                    add, word = word[:i]+'-', word[i:]
+                    words.append(add)
+                words.append(word)
+
+            lines = ['']
+            i = 0
+            for word in words:
+                space = ' ' if lines[i] else ''
+                if len(lines[i]+space+word) * char_w2 > max_width:
+                    if lines[i] == '':
+                        lines[i] += word
+                        lines.append('')
+                    else: lines.append(word)
+                    i += 1
+                else:
+                    lines[i] += space+word
+
+            # assemble lines into one surface
+            width = len(max(lines, key=lambda l: len(l)))*char_w2
+            surf = pygame.Surface((width, 12*len(lines)), SRCALPHA)
+            for y, line in enumerate(lines):
+                line = font2.render(line, True, Palette.text)
+                surf.blit(line, (width/2 - line.get_width()/2, y*12))
+
+            surfs[1] = Node.black_back(surf)
+        else:
+            # same text for both unselected and selected
+            surf = Node.black_back(font2.render(text, True, Palette.text))
+            surfs = [surf, surf]
+
+        return surfs
 
     def set_image(self, image):
-        """Sets and resizes self.surfs depending on self.size"""
-        s = self.size
+        """Sets the node's image, its surfaces are then taken from SurfaceCache"""
         self.image = image
-        self.cached_surfs = None # force cached surfaces refresh
-        self.cached_zoom = None
-        self.surfs = [None]*3
+
+    @staticmethod
+    def make_surf(s, state, image, i):
+        """Draws the surface of a node of size s, with state state and image image (can be None),
+        for the variant i: normal, hovered, or selected"""
 
         # draw empty box
         m = int(s/10) # outline margin
 
-        for i in range(3): # set normal, hovered, and selected surfaces
-            self.surfs[i] = pygame.Surface((s, s))
-            self.surfs[i].fill(Palette.box_outer[self.state][i])
-            pygame.draw.rect(self.surfs[i], Palette.box_sep[self.state][i], Rect(m-2, m-2, s - m*2 + 4, s - m*2 + 4))
-            pygame.draw.rect(self.surfs[i], Palette.box_inner[self.state][i], Rect(m, m, s - m*2, s - m*2))
+        surf = pygame.Surface((s, s))
+        surf.fill(Palette.box_outer[state][i])
+        pygame.draw.rect(surf, Palette.box_sep[state][i], Rect(m-2, m-2, s - m*2 + 4, s - m*2 + 4))
+        pygame.draw.rect(surf, Palette.box_inner[state][i], Rect(m, m, s - m*2, s - m*2))
 
         # if image, resize it and add it to the surface
         if image is not None:
@@ -589,9 +1412,9 @@ class Node(GraphObject):
             if w > h: w, h = s, s*h/w
             else: w, h = s*w/h, s
 
-            image = pygame.transform.scale(image.surf, (w, h))
-            for i in range(3):
-                self.surfs[i].blit(image, (m+1, m+1))
+            surf.blit(pygame.transform.scale(image.surf, (w, h)), (m+1, m+1))
+
+        return surf
 
     def collide(self, pos):
         """Checks if the given position in screen coordinates intersects with the node"""
@@ -605,29 +1428,45 @@ class Node(GraphObject):
         s = self.size/2
         return -s <= x < Graph.W+s and -s <= y < Graph.H+s
 
-    def update(self, events, surf, project, force_text=False):
+    def variant(self):
+        """Returns the index of the node colors and surface to use: 0 normal, 1 hovered, 2 selected"""
+        return 2 if self in graph.selection else 1 if self == graph.hovered or self in graph.box_selection else 0
+
+    def update(self, events, surf, project, force_text=False, lod=0, variant=None, zoom=None):
         """Called by grah update() each frame. Blits a surface onto surf at the position given by the projector.
-        The text is cut when not hovered/selected, but this can be overriden by setting force_text to True"""
+        The text is cut when not hovered/selected, but this can be overriden by setting force_text to True.
+        Param lod: level of detail (see Graph.lod), when not 0 the node is drawn as a flat rect or point, without text
+        Param variant: if set, overrides the hovered/selected state (see Node.variant)
+        Param zoom: zoom of the projector, graph.zoom by default"""
         x, y = project(self.x, self.y)
 
-        s = self.size if graph.zoom > 1 else self.size*graph.zoom
-
-        # refresh cached surfaces if needed
-        if self.cached_zoom != graph.zoom:
-            self.cached_surfs = [pygame.transform.smoothscale(surf, (s, s)) for surf in self.surfs]
+        if zoom is None: zoom = graph.zoom
+        s = self.size if zoom > 1 else max(int(self.size*zoom), 1)
 
         # use a different texture when hovered
-        i = 2 if self in graph.selection else 1 if self == graph.hovered else 0
-        surf.blit(self.cached_surfs[i], (x - s/2, y - s/2))
+        i = self.variant() if variant is None else variant
+        if lod:
+            if lod > 1: s = 2
+            surf.fill(Palette.box_outer[self.state][i], (x - s/2, y - s/2, s, s))
+            return
+        if self.image is not None: self.image.last_used = Image.frame # on screen, see Image.evict
+        surf.blit(SurfaceCache.get(self.size, self.state, self.image, i, s), (x - s/2, y - s/2))
 
         # draw text
         if self.text_surfs is not None:
             t = self.text_surfs[force_text or bool(i)]
             surf.blit(t, (x - t.get_width()/2, y + s/2 + 5))
 
+if np is not None:
+    # make the nodes attributes views onto their slot in Manager.store
+    for name in NodeStore.fields:
+        setattr(Node, name, NodeStore.view(name))
+
 class Link(GraphObject):
     """Link between two nodes in the graph"""
 
+    __slots__ = ('id', 'n1', 'n2', 'rank', 'size', 'state')
+
     rank_sizes = [2, 3, 5, 8, 15]
     assert len(rank_sizes) == Node.N_RANKS
 
@@ -696,8 +1535,23 @@ class Link(GraphObject):
         dx, dy = xm-xm2, ym-ym2
         return dx*dx + dy*dy <= s2
 
-    def update(self, events, surf, project):
-        """Called by grah update() each frame. Draws a line onto surf at the position given by the projector."""
+    def distance2(self, x, y):
+        """Returns the squared distance between the position (x, y) and the link segment, in graph units"""
+        x1, y1, x2, y2 = self.n1.x, self.n1.y, self.n2.x, self.n2.y
+        dx, dy = x2-x1, y2-y1
+        l2 = dx*dx + dy*dy
+
+        # t: position of the point projected onto the segment, clamped to the segment ends
+        t = 0 if l2 == 0 else ((x-x1)*dx + (y-y1)*dy) / l2
+        t = 0 if t < 0 else 1 if t > 1 else t
+
+        dx, dy = x - x1 - dx*t, y - y1 - dy*t
+        return dx*dx + dy*dy
+
+    def update(self, events, surf, project, lod=0, variant=None):
+        """Called by grah update() each frame. Draws a line onto surf at the position given by the projector.
+        Param lod: level of detail (see Graph.lod), when not 0 the link is drawn as a single 1px line
+        Param variant: if set, overrides the hovered/selected state: 0 normal, 1 hovered, 2 selected"""
 
         # get end nodes screen coordinates
         pos1 = project(self.n1.x, self.n1.y)
@@ -707,40 +1561,770 @@ class Link(GraphObject):
         else: pos2 = project(self.n2.x, self.n2.y)
 
         # get color depending on if the link is hovered/selected
-        i = 2 if self in graph.selection else 1 if self == graph.hovered else 0
+        if variant is None: i = 2 if self in graph.selection else 1 if self == graph.hovered else 0
+        else: i = variant
         col = Palette.link[self.state][i]
         col2 = Palette.link2[self.state][i]
 
+        if lod:
+            pygame.draw.line(surf, col, pos1, pos2)
+            return
+
         # get the actually displayed size and decide if need to draw a center line
         s = self.size if graph.zoom > 1 else self.size*graph.zoom
 
         pygame.draw.line(surf, col, pos1, pos2, 1 if s < 1 else int(s))
         if s >= 3: pygame.draw.line(surf, col2, pos1, pos2, int(s/3))
 
+    @staticmethod
+    def draw_all(links, surf, project, lod=0, variant=None, zoom=None):
+        """Draws links onto surf like their update() method, but grouped by (state, variant, width) so that colors
+        and widths are found once per group. With NumPy, the grouping is vectorized, the end points are projected
+        in one pass and the 1px lines are rasterized directly into the surface pixels.
+        Groups are drawn one after the other, each in the given order. The projector must also work on arrays.
+        Param variant: if set, overrides the hovered/selected state of all the links (see Link.update)
+        Param zoom: zoom of the projector, graph.zoom by default"""
+
+        # displayed line widths for each link size, the center line is not drawn when its width is 0
+        if zoom is None: zoom = graph.zoom
+        widths = {}
+        for size in Link.rank_sizes:
+            s = size if zoom > 1 else size*zoom
+            widths[size] = (1, 0) if lod or s < 1 else (int(s), 0) if s < 3 else (int(s), int(s/3))
+
+        drawn = [link for link in links if link.n2 is not None] # the link being created follows the mouse, drawn last
+        store = Manager.store
+        if store is None:
+            groups = {}
+            special = {obj: 2 for obj in graph.selection}
+            if graph.hovered is not None: special.setdefault(graph.hovered, 1)
+            for link in drawn:
+                key = (link.state, special.get(link, 0) if variant is None else variant, link.size)
+                group = groups.get(key)
+                if group is None: group = groups[key] = []
+                group.append(link)
+            # merge the groups of the sizes displayed with the same widths
+            merged = {}
+            for (state, i, size), group in groups.items():
+                merged.setdefault((state, i, *widths[size]), []).extend(group)
+            groups = ((key, ((project(link.n1.x, link.n1.y), project(link.n2.x, link.n2.y)) for link in group))
+                      for key, group in sorted(merged.items()))
+        else:
+            groups = Link.group_ends(drawn, project, widths, variant)
+
+        for (state, i, width, width2), ends in groups:
+            col = Palette.link[state][i]
+            col2 = Palette.link2[state][i]
+            if type(ends) == tuple:
+                # end points arrays
+                if width == 1 and Link.rasterize(surf, *ends, col): continue
+                x1, y1, x2, y2 = (array.tolist() for array in ends)
+                ends = zip(zip(x1, y1), zip(x2, y2))
+            for pos1, pos2 in ends:
+                pygame.draw.line(surf, col, pos1, pos2, width)
+                if width2: pygame.draw.line(surf, col2, pos1, pos2, width2)
+
+        for link in links:
+            if link.n2 is None: link.update([], surf, project, lod, variant)
+
+    @staticmethod
+    def group_ends(links, project, widths, variant=None):
+        """Vectorized grouping of Link.draw_all, only used with NumPy.
+        Yields the groups keys (state, variant, width, center width) in order,
+        with the arrays (x1, y1, x2, y2) of the projected end points of their links."""
+
+        n = len(links)
+        get = lambda attr: np.fromiter(map(attrgetter(attr), links), np.intp, n)
+        state, size = get('state'), get('size')
+        if variant is not None: i = np.full(n, variant)
+        else:
+            ids = get('id')
+            i = np.where(ids == (graph.hovered.id if type(graph.hovered) == Link else -1), 1, 0)
+            i[np.isin(ids, [obj.id for obj in graph.selection if type(obj) == Link])] = 2
+
+        width = np.zeros(max(Link.rank_sizes)+1, np.intp)
+        width2 = np.zeros_like(width)
+        for s, (w, w2) in widths.items(): width[s], width2[s] = w, w2
+
+        # sort the links by group, keeping the given order inside groups
+        key = ((state*3 + i) * 256 + width[size]) * 256 + width2[size]
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.diff(key, prepend=-1))
+
+        store = Manager.store
+        slots1, slots2 = get('n1.slot')[order], get('n2.slot')[order]
+        x1, y1 = project(store.x[slots1], store.y[slots1])
+        x2, y2 = project(store.x[slots2], store.y[slots2])
+        for start, stop in zip(starts, (*starts[1:], n)):
+            k = int(key[start])
+            yield ((k >> 16) // 3, (k >> 16) % 3, (k >> 8) & 255, k & 255), \
+                  (x1[start:stop], y1[start:stop], x2[start:stop], y2[start:stop])
+
+    @staticmethod
+    def rasterize(surf, x1, y1, x2, y2, col):
+        """Draws 1px lines between the points (x1, y1) and (x2, y2), given as NumPy arrays, directly into the pixels of surf.
+        The lines are clipped to the surface, then all their pixels are computed at once.
+        Returns False if the pixels of surf can't be accessed this way (24 bits surfaces), then nothing is drawn."""
+
+        if surf.get_bytesize() == 3: return False
+        w, h = surf.get_size()
+
+        # clip the lines to the surface (Liang-Barsky): keep the part of each line between t0 and t1
+        dx, dy = x2-x1, y2-y1
+        t0, t1 = np.zeros(len(x1)), np.ones(len(x1))
+        outside = np.zeros(len(x1), bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for p, q in ((-dx, x1), (dx, w-1-x1), (-dy, y1), (dy, h-1-y1)):
+                r = q / p
+                t0 = np.where(p < 0, np.maximum(t0, r), t0)
+                t1 = np.where(p > 0, np.minimum(t1, r), t1)
+                outside |= (p == 0) & (q < 0) # parallel to this border, and outside of it
+        keep = ~outside & (t0 <= t1)
+        x1, y1, dx, dy, t0, t1 = x1[keep], y1[keep], dx[keep], dy[keep], t0[keep], t1[keep]
+        x1, y1, x2, y2 = x1 + dx*t0, y1 + dy*t0, x1 + dx*t1, y1 + dy*t1
+        if not len(x1): return True
+
+        # one pixel per step along the longest axis of each line, processed by chunks to bound the memory used
+        steps = np.maximum(abs(x2-x1), abs(y2-y1)).astype(np.intp) + 1
+        ends = np.cumsum(steps)
+        pixels = pygame.surfarray.pixels2d(surf)
+        color = surf.map_rgb(col) & 0xFFFFFFFF # negative with per-pixel alpha, written into unsigned pixels
+        start, chunk = 0, 1 << 20
+        while start < len(steps):
+            stop = max(int(np.searchsorted(ends, ends[start] - steps[start] + chunk)), start+1)
+            n = steps[start:stop]
+            line = np.repeat(np.arange(start, stop), n)
+            k = np.arange(len(line)) - np.repeat(ends[start:stop] - n, n) # step index in its line
+            t = k / np.maximum(steps[line] - 1, 1)
+            px = (x1[line] + (x2-x1)[line] * t).astype(np.intp)
+            py = (y1[line] + (y2-y1)[line] * t).astype(np.intp)
+            pixels[np.clip(px, 0, w-1), np.clip(py, 0, h-1)] = color
+            start = stop
+        del pixels # unlock the surface
+        return True
+
+def map_file(file):
+    """Returns a read-only memory map of a whole file"""
+    with open(file, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def entry_view(z, name, memory):
+    """Returns a memoryview of the content of a zip entry. Entries stored without compression are not copied:
+    the view is taken from memory, memory map of the zip file (see map_file), otherwise the entry is read.
+    The views should be released before closing the memory map."""
+    info = z.getinfo(name)
+    if info.compress_type != ZIP_STORED: return memoryview(z.read(name))
+
+    # the data comes after the local file header: fixed size, then the file name and extra field of variable sizes
+    if memory[info.header_offset:info.header_offset+4] != b'PK\x03\x04': raise BadZipFile('Bad magic number for file header')
+    n, m = struct.unpack_from('<HH', memory, info.header_offset + 26)
+    start = info.header_offset + 30 + n + m
+    if start + info.file_size > len(memory): raise BadZipFile('Truncated file %s' %name)
+    return memoryview(memory)[start:start+info.file_size]
+
 class Image:
     """Pygame surface loaded from image file.
-    The stored path is cut to the base name, to then be cached in the save zip file."""
+    The stored path is cut to the base name, to then be cached in the save zip file.
+    Images of a save file are lazy: only their zip entry is known, and they are decoded on first use.
+    Decoded lazy images can be unloaded again to fit in Image.budget, when they are off-screen.
+    Images are identified by a hash of their pixels, their key, which also names their zip entry."""
 
-    def __init__(self, path, content, id):
-        """Loads an image from the save zip file (content is a bytes array)
-        or from the disk (content is None, and path is used to load the image)"""
+    __slots__ = ('path', 'name', '_surf', 'id', 'source', 'last_used', 'key')
+
+    budget = None # optional maximum memory taken by the decoded lazy images, in bytes
+
+    decoded = OrderedDict() # key: decoded lazy image, value: its size in bytes, least recently used first
+    used = 0 # memory taken by the decoded lazy images, in bytes
+    frame = 0 # frame counter, images used during the current frame are on screen
+    archive = None # (file name, ZipFile, memory map) of the last save file read by lazy images, kept open
+
+    def __init__(self, path, content, source, id):
+        """Loads an image from the save zip file (content is a bytes array),
+        from the disk (content is None, and path is used to load the image),
+        or lazily from the save zip file source = (file name, entry name), then content is None"""
 
         self.path = basename(path).replace(' ', '_')
         self.name = splitext(self.path)[0]
-        if content is None:
-            # load image from disk
-            self.surf = pygame.image.load(path).convert_alpha()
+        self.source = source
+        self.last_used = Image.frame
+        if source is not None:
+            self._surf = None # decoded on first use
+            # entries named by a key (see Image.entry) give it without decoding
+            key = self.name.lower()
+            self.key = key if len(key) == 40 and all(c in '0123456789abcdef' for c in key) else None
         else:
-            # get the width, height, and image data from content
-            i = content.index(b'.')
-            w = int(content[:i].decode())
-            content = content[i+1:]
-            i = content.index(b'.')
-            h = int(content[:i].decode())
-            content = content[i+1:]
-            self.surf = pygame.image.frombytes(content, (w, h), 'RGBA')
+            if content is None:
+                # load image from disk
+                self._surf = pygame.image.load(path).convert_alpha()
+            else:
+                self._surf = Image.decode(content)
+            self.key = Image.pixels_key(self._surf)
         self.id = id
 
+    @staticmethod
+    def pixels_key(surf):
+        """Returns the key of an image surface: hash of its size and pixels"""
+        w, h = surf.get_size()
+        return sha1(b'%d.%d.%s' %(w, h, pygame.image.tostring(surf, 'RGBA'))).hexdigest()
+
+    def entry(self):
+        """Returns the name of the zip entry of the image in a save file, from its key.
+        Images with the same pixels share the same entry."""
+        if self.key is None: self.key = Image.pixels_key(self.surf)
+        return self.key + '.png'
+
+    png_signature = b'\x89PNG\r\n\x1a\n'
+
+    @staticmethod
+    def decode(content):
+        """Returns the surface stored in the content of an image zip entry, bytes or memoryview (see Image.read).
+        Entries are PNG files, or in the legacy format: width, height and raw RGBA data separated by dots.
+        The pixels are only copied once, into the returned surface."""
+        if content[:8] == Image.png_signature:
+            return pygame.image.load(BytesIO(content), 'png')
+
+        # get the width and height from the start of content
+        w, h, _ = bytes(content[:32]).split(b'.', 2)
+        start = len(w) + len(h) + 2
+        # the image data is wrapped by a surface without copying it, then copied into a surface of its own
+        return pygame.image.frombuffer(content[start:], (int(w), int(h)), 'RGBA').copy()
+
+    def encode(self):
+        """Returns the content of the zip entry of the image in a save file, as a PNG file.
+        Lazy images that are not decoded are copied from their zip entry if it is already a PNG file."""
+        if self._surf is None:
+            try:
+                content = Image.read(*self.source)
+                if content[:8] == Image.png_signature: return bytes(content)
+            except Exception: pass # decoded below, or replaced by an empty image
+
+        return Image.png(self.surf)
+
+    @staticmethod
+    def png(surf):
+        """Returns the content of a PNG file of a surface"""
+        file = BytesIO()
+        pygame.image.save(surf, file, 'png')
+        return file.getvalue()
+
+    @property
+    def surf(self):
+        """Surface of the image, lazy images are decoded when needed"""
+        self.last_used = Image.frame
+        if self._surf is None:
+            try:
+                self._surf = Image.decode(Image.read(*self.source))
+                Image.drop_pages()
+            except Exception as e:
+                print('Error loading image %s: %s' %(self.path, e))
+                self._surf = pygame.Surface((1, 1), SRCALPHA)
+            Image.track(self)
+            Image.evict()
+        elif self in Image.decoded:
+            Image.decoded.move_to_end(self)
+        return self._surf
+
+    def loaded(self):
+        """Makes a lazy image a normal image, decoded and kept in memory"""
+        self.surf
+        Image.used -= Image.decoded.pop(self, 0)
+        self.source = None
+
+    @staticmethod
+    def read(file, name):
+        """Returns the content of the entry name in the zip file, which is kept open for the next reads.
+        The content is a memoryview, of the memory map of the file for the uncompressed entries (see entry_view):
+        it should not be kept, as the file can be overwritten once closed."""
+        if Image.archive is None or Image.archive[0] != file:
+            Image.close()
+            z = ZipFile(file)
+            try: Image.archive = file, z, map_file(file)
+            except Exception:
+                z.close()
+                raise
+        file, z, memory = Image.archive
+        return entry_view(z, name, memory)
+
+    @staticmethod
+    def drop_pages():
+        """Removes the pages of the save file read by the decoded lazy images from the memory of the process,
+        where the memory map allows it: they are read again from the file when needed"""
+        if Image.archive is not None and hasattr(mmap, 'MADV_DONTNEED'):
+            Image.archive[2].madvise(mmap.MADV_DONTNEED)
+
+    @staticmethod
+    def close():
+        """Closes the save file lazy images read from, it is opened again when needed"""
+        if Image.archive is not None:
+            file, z, memory = Image.archive
+            Image.archive = None
+            z.close()
+            try: memory.close()
+            except BufferError: pass # a view is still used, the memory map is closed once it is released
+
+    @staticmethod
+    def track(image):
+        """Counts a decoded lazy image in the memory used, to be unloaded by Image.evict"""
+        w, h = image._surf.get_size()
+        Image.decoded[image] = w * h * image._surf.get_bytesize()
+        Image.used += Image.decoded[image]
+
+    @staticmethod
+    def evict():
+        """Unloads the least recently used lazy images until they fit in Image.budget.
+        Images used during the current frame are on screen, and are never unloaded."""
+        if Image.budget is None: return
+        for image in list(Image.decoded):
+            if Image.used <= Image.budget: break
+            if image.last_used == Image.frame: continue
+            Image.used -= Image.decoded.pop(image)
+            image._surf = None
+
+    @staticmethod
+    def clear():
+        """Forgets the decoded lazy images, when the Manager is reset"""
+        Image.decoded.clear()
+        Image.used = 0
+        Image.close()
+
+class TileCache:
+    """Cache of the graph content rendered into square tiles, of fixed size in graph coordinates at each zoom level.
+    Used while panning: the screen is then made of cached tiles, rendered with all objects as not hovered nor selected,
+    and only the hovered and selected objects are drawn live on top of them."""
+
+    tile_size = 256 # in pixels
+    budget = 64 * 1024*1024 # maximum memory taken by the tiles, in bytes
+
+    def __init__(self):
+        self.tiles = OrderedDict() # key: (level, tx, ty), value: surface, in least recently used order
+        self.levels = {} # key: zoom level, value: set of the (tx, ty) of the cached tiles at this level
+        self.zooms = {} # key: zoom level, value: zoom the tiles of this level were rendered at
+
+    @staticmethod
+    def level(zoom):
+        """Returns the integer zoom level of a zoom, each mouse wheel step changes it by one.
+        The zoom itself drifts when zooming in and out, and cannot be used as a key."""
+        return round(log(zoom, 1.2))
+
+    @staticmethod
+    def world_size(zoom):
+        """Returns the size of the tiles in graph units at a zoom"""
+        return TileCache.tile_size / (zoom * Graph.unit_size)
+
+    def draw(self, surf, graph):
+        """Blits the tiles covering the screen onto surf, rendering the missing ones"""
+        level = TileCache.level(graph.zoom)
+        # tiles rendered at another zoom of the same level, for example set by a file, cannot be reused
+        if level in self.zooms and not isclose(self.zooms[level], graph.zoom):
+            self.remove_level(level)
+        zoom = self.zooms.setdefault(level, graph.zoom)
+        ws = TileCache.world_size(zoom)
+        x0, y0, x1, y1 = graph.view_rect()
+
+        for tx in range(floor(x0/ws), floor(x1/ws)+1):
+            for ty in range(floor(y0/ws), floor(y1/ws)+1):
+                key = (level, tx, ty)
+                tile = self.tiles.get(key)
+                if tile is None:
+                    tile = self.tiles[key] = self.render(graph, zoom, tx, ty)
+                    self.levels.setdefault(level, set()).add((tx, ty))
+                else: self.tiles.move_to_end(key)
+                surf.blit(tile, graph.project(tx*ws, ty*ws))
+
+        self.evict()
+
+    def render(self, graph, zoom, tx, ty):
+        """Renders the tile (tx, ty) at a zoom"""
+        size = TileCache.tile_size
+        z = zoom * Graph.unit_size
+        ws = size / z
+        wx, wy = tx*ws, ty*ws
+        project = lambda x, y: ((x-wx) * z, (y-wy) * z)
+
+        # objects around the tile, the margins account for their size
+        m = (Node.rank_sizes[-1]/2 + Graph.text_margin) / z
+        ml = Link.rank_sizes[-1]/2 / z
+        nodes, links = Manager.grid.query((wx-m, wy-m, wx+ws+m, wy+ws+m), (wx-ml, wy-ml, wx+ws+ml, wy+ws+ml))
+
+        tile = pygame.Surface((size, size))
+        tile.fill(Palette.background)
+        lod = graph.lod()
+        Link.draw_all(sorted(links, key=lambda link: link.id), tile, project, lod, variant=0)
+        for node in sorted(nodes, key=Node.draw_order):
+            node.update([], tile, project, lod=lod, variant=0)
+
+        return tile
+
+    def evict(self):
+        """Removes the least recently used tiles until the cache fits in the memory budget"""
+        max_tiles = TileCache.budget // (TileCache.tile_size**2 * 4)
+        while len(self.tiles) > max_tiles:
+            (level, tx, ty), tile = self.tiles.popitem(last=False)
+            self.remove_key(level, (tx, ty))
+
+    def remove_key(self, level, key):
+        keys = self.levels[level]
+        keys.discard(key)
+        if not keys:
+            del self.levels[level]
+            del self.zooms[level]
+
+    def remove_level(self, level):
+        """Removes all the tiles of a zoom level"""
+        for tx, ty in self.levels.pop(level, ()):
+            del self.tiles[(level, tx, ty)]
+        del self.zooms[level]
+
+    def invalidate(self, x0, y0, x1, y1, margin):
+        """Removes the tiles touching the rectangle (x0, y0, x1, y1) in graph coordinates, extended by margin pixels"""
+        for level, keys in list(self.levels.items()):
+            zoom = self.zooms[level]
+            ws = TileCache.world_size(zoom)
+            m = margin / (zoom * Graph.unit_size)
+            tx0, ty0 = floor((x0-m)/ws), floor((y0-m)/ws)
+            tx1, ty1 = floor((x1+m)/ws), floor((y1+m)/ws)
+
+            if (tx1-tx0+1) * (ty1-ty0+1) > len(keys):
+                touched = [key for key in keys if tx0 <= key[0] <= tx1 and ty0 <= key[1] <= ty1]
+            else:
+                touched = [(tx, ty) for tx in range(tx0, tx1+1) for ty in range(ty0, ty1+1) if (tx, ty) in keys]
+
+            for key in touched:
+                del self.tiles[(level, *key)]
+                self.remove_key(level, key)
+
+    def invalidate_object(self, obj):
+        """Removes the tiles containing a graph object"""
+        if type(obj) == Node:
+            self.invalidate(obj.x, obj.y, obj.x, obj.y, Node.rank_sizes[-1]/2 + Graph.text_margin)
+        elif obj.n2 is not None:
+            x0, x1 = sorted((obj.n1.x, obj.n2.x))
+            y0, y1 = sorted((obj.n1.y, obj.n2.y))
+            self.invalidate(x0, y0, x1, y1, Link.rank_sizes[-1]/2)
+
+class PngWriter:
+    """Png image written band of rows by band of rows, so that the whole image is never held in memory.
+    The rows are written unfiltered in RGBA, and compressed by zlib into an IDAT chunk per band."""
+
+    compress_level = 6 # zlib compression level, from 0 to 9
+
+    def __init__(self, file, width, height):
+        self.file = open(file, 'wb')
+        self.compressor = zlib.compressobj(PngWriter.compress_level)
+        self.file.write(Image.png_signature)
+        # 8 bits per channel, RGBA, default compression, filtering and no interlacing
+        self.chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, surf):
+        """Appends the rows of a surface as wide as the image"""
+        data = memoryview(pygame.image.tostring(surf, 'RGBA'))
+        stride = surf.get_width() * 4
+        # each row starts with its filter type, 0: none
+        rows = b''.join(chain.from_iterable((b'\0', data[i:i+stride]) for i in range(0, len(data), stride)))
+        compressed = self.compressor.compress(rows)
+        if compressed: self.chunk(b'IDAT', compressed)
+
+    def close(self):
+        """Ends the image once all the rows are written, and closes the file"""
+        self.chunk(b'IDAT', self.compressor.flush())
+        self.chunk(b'IEND', b'')
+        self.file.close()
+
+class BinaryFormat:
+    """Binary replacement of save.txt, the save.bin zip entry, stored without compression to be memory-mapped.
+    It is made of fixed-width little-endian records, read at once with struct without parsing them one by one:
+    the header, the nodes, links, images, image attachments and texts tables, then the string table,
+    which contains the texts and the image entry names in UTF-8, referenced by their offset and length."""
+
+    magic = b'PGRAPH\x00\x01'
+    # magic, scroll x, scroll y, zoom, then number of nodes, links, images, attachments and texts
+    header = struct.Struct('<8sddd5Q')
+    tables = (struct.Struct('<ddiiq'), # node: x, y, rank, state, id
+              struct.Struct('<qqq'), # link: n1 ID, n2 ID, id
+              struct.Struct('<qQQ'), # image: id, entry name offset, entry name length
+              struct.Struct('<qq'), # image attachment: node ID, image ID
+              struct.Struct('<qQQ')) # text: node ID, text offset, text length
+
+    @staticmethod
+    def pack(scroll_x, scroll_y, zoom, nodes, links, entries):
+        """Returns the content of the save.bin entry of a save file, same parameters as Graph.serialize"""
+        strings = bytearray()
+        def string(text):
+            data = text.encode('utf-8')
+            strings.extend(data)
+            return len(strings)-len(data), len(data)
+
+        tables = ([(x, y, rank, state, id) for id, x, y, rank, state, text, image in nodes],
+                  [(n1, n2, id) for id, n1, n2 in links],
+                  [(image.id, *string(name)) for image, name in entries.items()],
+                  [(id, image.id) for id, x, y, rank, state, text, image in nodes if image is not None],
+                  [(id, *string(text)) for id, x, y, rank, state, text, image in nodes if text])
+
+        header = BinaryFormat.header.pack(BinaryFormat.magic, scroll_x, scroll_y, zoom, *map(len, tables))
+        return b''.join((header, *(b''.join(starmap(record.pack, rows)) for record, rows in zip(BinaryFormat.tables, tables)), strings))
+
+    @staticmethod
+    def read(view):
+        """Returns the camera values (scroll x, scroll y, zoom) and the tables sizes of a save.bin content,
+        for each table a function yielding its rows by batches of Graph.bulk_size, and a function reading a string"""
+        values = BinaryFormat.header.unpack_from(view)
+        if values[0] != BinaryFormat.magic: raise ValueError('unknown binary format')
+
+        offset = BinaryFormat.header.size
+        tables = []
+        for record, count in zip(BinaryFormat.tables, values[4:]):
+            def rows(start=offset, size=record.size*count, record=record):
+                step = Graph.bulk_size * record.size
+                for i in range(start, start+size, step):
+                    yield list(record.iter_unpack(view[i:min(i+step, start+size)]))
+            tables.append(rows)
+            offset += record.size*count
+        if offset > len(view): raise ValueError('truncated binary save')
+
+        def string(start, length):
+            if offset+start+length > len(view): raise ValueError('string out of the binary save')
+            return str(view[offset+start:offset+start+length], 'utf-8')
+        return values[1:4], values[4:], tables, string
+
+class Autosave:
+    """Periodic saving of the unsaved changes into a side file, offered to be restored at startup after a crash.
+    The graph is copied on the main thread, a few objects at each frame within Autosave.frame_budget: the objects edited
+    in the meantime are copied again at the end (see Graph.edited), so that the copy matches the graph at a single frame.
+    The copy is then written by a worker thread, to a temporary file that replaces the side file once complete.
+    The garbage collector is disabled from the start of the copy until it is written or cancelled (see Autosave.restore),
+    for the whole process: collecting the generations that contain the copied rows would stop the frames for a long time.
+    Cyclic garbage made by the main thread meanwhile is only collected afterwards, a few seconds later for large graphs."""
+
+    interval = 60 # time between the autosaves of unsaved changes, in seconds
+    frame_budget = 0.001 # maximum time taken by copying the graph at each frame, in seconds
+    switch_interval = 0.0005 # maximum time the worker thread holds the GIL while the main thread waits for it, in seconds
+    skip_chunk = 256 # objects skipped at once when walking the dictionaries again, see Autosave.walk
+    folder = join(expanduser('~'), '.progression-graph') # folder of the side files
+
+    def __init__(self):
+        self.lock = Lock() # held while writing a side file, or a save file the lazy images are read from
+        self.generation = 0 # increased when the changes are saved or abandoned, to drop the autosaves written before
+        self.thread = None # worker thread of the last autosave
+        self.written = set() # side files written since the start
+        self.error = None # message of the last failed autosave, shown by the main thread, see Autosave.update
+
+        self.last = perf_counter() # time of the last autosave or save
+        self.dirty = False # True if the graph was edited since the last autosave or save
+
+        # copy of the graph in progress, None otherwise
+        self.nodes = None # list of (id, x, y, rank, state, text, image) rows
+        self.links = None # list of (id, n1 ID, n2 ID) rows
+        self.pending = None # iterator over the objects left to copy, see Autosave.walk
+        self.dirty_nodes = set() # IDs of the objects edited during the copy
+        self.dirty_links = set()
+        self.gc_enabled = None # state of the garbage collector to restore once the copy is written or cancelled
+        self.saved_interval = None # switch interval to restore, see Autosave.switch_interval
+
+    @staticmethod
+    def side_file(save_file):
+        """Returns the path of the side file of a save file, or of a new file if save_file is None"""
+        name = 'untitled' if save_file is None else abspath(save_file)
+        return join(Autosave.folder, 'autosave-%s.graph' %sha1(name.encode()).hexdigest()[:16])
+
+    def copying(self):
+        return self.nodes is not None
+
+    def edited(self, objs):
+        """Marks graph objects as changed, the ones that were already copied are copied again at the end"""
+        self.dirty = True
+        if self.nodes is None: return
+        for obj in objs:
+            if type(obj) == Node: self.dirty_nodes.add(obj.id)
+            else: self.dirty_links.add(obj.id)
+
+    def clear(self):
+        """Drops the copy of the graph in progress, or the one handed to the worker thread"""
+        self.nodes = self.links = self.pending = None
+        self.dirty_nodes = set()
+        self.dirty_links = set()
+        self.dirty = False
+        self.last = perf_counter()
+
+    def cancel(self):
+        """Stops copying the graph, when it is replaced or saved"""
+        self.clear()
+        self.restore()
+
+    def restore(self):
+        """Enables the garbage collector again and restores the switch interval, if an autosave changed them.
+        Called by the worker thread once the copy is written, or when the copy is cancelled."""
+        gc_enabled, interval = self.gc_enabled, self.saved_interval
+        self.gc_enabled = self.saved_interval = None
+        if gc_enabled: gc.enable()
+        if interval is not None: sys.setswitchinterval(interval)
+
+    def update(self, graph):
+        """Called each frame: starts copying the graph after Autosave.interval if it was edited,
+        continues the copy, and hands it to a worker thread once complete.
+        The error of a failed autosave is shown here, as the worker thread cannot show popups."""
+        if self.error is not None:
+            message, self.error = self.error, None
+            Error.show(message)
+            graph.invalidate() # the popup was drawn over the screen
+
+        writing = self.thread is not None and self.thread.is_alive()
+        if self.nodes is None:
+            if not self.dirty or perf_counter()-self.last < Autosave.interval: return
+            if writing: return
+            self.nodes, self.links = [], []
+            self.pending = self.walk()
+            self.dirty = False
+            self.gc_enabled = gc.isenabled()
+            gc.disable()
+
+        end = perf_counter() + Autosave.frame_budget
+        for i, obj in enumerate(self.pending, 1):
+            if obj is not None:
+                row = Autosave.copy(obj)
+                if row is not None: (self.nodes if type(obj) == Node else self.links).append(row)
+            if not i%64 and perf_counter() > end: return
+
+        # copy again the objects edited since they were copied, None for the removed ones
+        edited = {}, {} # key: ID, value: row or None, for the nodes and the links
+        for ids, objs, rows in zip((self.dirty_nodes, self.dirty_links), (Manager.nodes, Manager.links), edited):
+            for id in ids:
+                rows[id] = None if id not in objs else Autosave.copy(objs[id])
+
+        snapshot = graph.save_file, graph.scroll_x, graph.scroll_y, graph.zoom, self.nodes, self.links, edited
+        # the main thread waits less for the GIL while the worker thread runs
+        self.saved_interval = sys.getswitchinterval()
+        sys.setswitchinterval(Autosave.switch_interval)
+        self.thread = Thread(target=self.write, args=(snapshot, self.generation), daemon=True)
+        self.thread.start()
+        self.clear()
+
+    def walk(self):
+        """Yields the nodes then the links, from the dictionaries themselves as copying them would take a single long frame.
+        Their iterators cannot be used after objects were added or removed between two frames: the iteration then starts
+        again, skipping the objects already yielded, minus one for each object removed as it moved the next ones back.
+        The objects yielded twice are copied again, and the removed ones are dirty. None is yielded while skipping."""
+        for objs in (Manager.nodes, Manager.links):
+            values, pos, skip = None, 0, 0
+            while True:
+                if values is None or len(objs) != size or Manager.removed != removed:
+                    if values is not None: skip = max(0, max(pos, skip) - (Manager.removed-removed))
+                    values, pos, size, removed = iter(objs.values()), 0, len(objs), Manager.removed
+
+                if pos < skip:
+                    n = min(Autosave.skip_chunk, skip-pos)
+                    next(islice(values, n-1, None), None)
+                    pos += n
+                    yield None
+                    continue
+
+                obj = next(values, None)
+                if obj is None: break
+                pos += 1
+                yield obj
+
+    @staticmethod
+    def copy(obj):
+        """Returns the row of the values of a node or a link, None for a link being created as it is not saved"""
+        if type(obj) == Node: return obj.id, obj.x, obj.y, obj.rank, obj.state, obj.text, obj.image
+        if obj.n2 is not None: return obj.id, obj.n1.id, obj.n2.id
+
+    def write(self, snapshot, generation):
+        """Writes a copy of the graph into its side file, from the worker thread, then restores the garbage collector
+        and the switch interval. Lazy images are copied from their zip entry without being decoded."""
+        try: self.write_side(snapshot, generation)
+        finally: self.restore()
+
+    def write_side(self, snapshot, generation):
+        save_file, scroll_x, scroll_y, zoom, nodes, links, edited = snapshot
+        side = Autosave.side_file(save_file)
+        archives = {} # key: file name, value: ZipFile the lazy images are copied from
+
+        with self.lock:
+            if generation != self.generation: return # saved or abandoned in the meantime
+            try:
+                # replace the rows of the objects edited during the copy
+                nodes, links = ({row[0]: row for row in rows} for rows in (nodes, links))
+                for rows, changes in zip((nodes, links), edited):
+                    for id, row in changes.items():
+                        if row is None: rows.pop(id, None)
+                        else: rows[id] = row
+
+                os.makedirs(Autosave.folder, exist_ok=True)
+                with ZipFile(side+'.tmp', 'w', ZIP_DEFLATED, compresslevel=Graph.compress_level) as z:
+                    z.writestr('autosave.txt', '' if save_file is None else abspath(save_file))
+
+                    entries = {} # key: image, value: entry name
+                    names = set() # entries already written, several images can share the same entry
+                    for image in dict.fromkeys(row[6] for row in nodes.values() if row[6] is not None):
+                        # read the attributes once, source first: Image.loaded sets _surf before clearing source,
+                        # and only the lazy images are evicted, so one of them is always set
+                        source = image.source
+                        surf = image._surf
+                        if source is None:
+                            entries[image] = image.key+'.png'
+                            content = Image.png(surf)
+                        else:
+                            entries[image] = source[1]
+                            if source[0] not in archives: archives[source[0]] = ZipFile(source[0])
+                            content = archives[source[0]].read(source[1])
+                        if entries[image] not in names: z.writestr(entries[image], content, ZIP_STORED)
+                        names.add(entries[image])
+
+                    z.writestr('save.txt', Graph.serialize(scroll_x, scroll_y, zoom, list(nodes.values()), list(links.values()), entries))
+                os.replace(side+'.tmp', side)
+                self.written.add(side)
+            except Exception as e:
+                self.error = 'Could not autosave the unsaved changes to %s:\n"%s"' %(side, e)
+            finally:
+                for archive in archives.values(): archive.close()
+
+    def discard(self, save_file):
+        """Removes the side files, when the changes are saved or abandoned.
+        The images read from them are loaded first, and the autosave being written is dropped."""
+        self.cancel()
+        with self.lock:
+            self.generation += 1
+            for side in self.written | {Autosave.side_file(save_file)}:
+                if not exists(side): continue
+                for image in Manager.images.values():
+                    if image.source is not None and image.source[0] == side: image.loaded()
+                Image.close()
+                os.remove(side)
+            self.written = set()
+
+    def recover(self, graph):
+        """Offers to restore the newest side file at startup, left after a crash"""
+        try:
+            files = [join(Autosave.folder, name) for name in os.listdir(Autosave.folder)
+                     if name.startswith('autosave-') and name.endswith('.graph')]
+            if not files: return
+            side = max(files, key=getmtime)
+            with ZipFile(side) as z: save_file = z.read('autosave.txt').decode() or None
+        except Exception: return
+
+        res = ask_button('Unsaved changes of %s were autosaved on %s.\nDo you want to restore them?'
+                         %('a new file' if save_file is None else basename(save_file), strftime('%Y-%m-%d %H:%M', localtime(getmtime(side)))),
+                         [(0, 'Yes'), (1, 'Delete'), (None, 'Later')])
+        if res == 1: os.remove(side)
+        if res != 0: return
+
+        graph.open(side, True)
+        if graph.save_file != side: return # failed to open
+        # removed with the other side files once the changes are saved or abandoned, even if the file is saved elsewhere
+        self.written.add(side)
+
+        # the save file is rewritten as a whole with the restored changes
+        graph.save_file = save_file
+        graph.journal_file = None
+        graph.changes = True
+        set_title(save_file, True)
+
 class UI:
     """UI elements on top of the screen: help, info about selection"""
 
@@ -826,13 +2410,30 @@ class UI:
             pygame.draw.rect(self.zoom_surf, col, Rect(_w + 5 + i*w, 2, w, 8))
         self.zoom_surf.blit(text, (0, 0))
 
-    def update(self, zoom):
-        """Displays the cached surface to the screen, updates zoom indicator.
+    def hovered(self):
+        """Returns True if the mouse is over the top bar, which is then displayed transparent"""
+        return pygame.mouse.get_pos()[1] < self.surf.get_height() and pygame.mouse.get_focused()
+
+    def bar_rect(self):
+        """Returns the screen Rect of the top bar"""
+        return Rect(0, 0, Graph.W, self.surf.get_height())
+
+    def zoom_rect(self):
+        """Returns the screen Rect of the zoom indicator"""
+        w = 0 if self.zoom_surf is None else self.zoom_surf.get_width()
+        return Rect(Graph.W-w-10, self.surf.get_height()+12, w, 12)
+
+    def animating(self):
+        """Returns True while the zoom indicator is displayed, as it fades out"""
+        return ticks()-self.last_zoom < 3000
+
+    def update(self, zoom, surf):
+        """Displays the cached surface onto surf (the screen), updates zoom indicator.
         Param zoom: boolean, True if changed zoom this frame"""
 
         height = self.surf.get_height()
-        self.surf.set_alpha(100 if pygame.mouse.get_pos()[1] < height and pygame.mouse.get_focused() else 255)
-        screen.blit(self.surf, (0, 0))
+        self.surf.set_alpha(100 if self.hovered() else 255)
+        surf.blit(self.surf, (0, 0))
 
         if zoom: self.last_zoom = ticks()
         dt = ticks()-self.last_zoom
@@ -844,7 +2445,7 @@ class UI:
 
             w = self.zoom_surf.get_width()
             self.zoom_surf.set_alpha(255 if dt < 2000 else (3000-dt)*0.255)
-            screen.blit(self.zoom_surf, (Graph.W-w-10, height+12))
+            surf.blit(self.zoom_surf, (Graph.W-w-10, height+12))
 
 class Graph:
     """Graph manager, for displaying the graph, handling scroll, and updating elements"""
@@ -852,6 +2453,21 @@ class Graph:
     H = 500
 
     unit_size = 100 # graph unit to pixel ratio
+    text_margin = 150 # maximum distance in pixels between the node texts and the nodes boxes
+    export_tile = 256 # size of the tiles rendered by Graph.export_file, in pixels
+
+    # levels of detail: below each of these zoom values, nodes are respectively drawn as flat rects
+    # (and links as 1px lines, texts are hidden), as points, then aggregated into density cells
+    lod_zooms = (0.25, 0.08, 0.02)
+    density_cell = 4 # density cells size, in pixels
+
+    use_tiles = True # use a TileCache when panning
+    bulk_size = 4096 # number of nodes or links added at once when opening a file
+    parse_share = 0.9 # part of the progress bar when opening a file taken by the entries, the rest by the images
+    compress_level = 6 # zlib compression level of save.txt in the save files, from 0 to 9
+    binary_format = False # save the new files in the binary format (save.bin) instead of the text format (save.txt)
+    incremental = True # append the changes to the journal of the save file instead of rewriting it, see Graph.save
+    journal_limit = 32 # number of journal entries after which the save file is compacted
 
     def __init__(self):
         assert Palette.init
@@ -861,18 +2477,43 @@ class Graph:
         self.zoom = 1
 
         self.save_file = None
+        self.binary = Graph.binary_format # format of the save file, see BinaryFormat
+        self.load_progress = 0 # progress of the file being opened, from 0 to 1, see Graph.load
+
+        # incremental saving, see Graph.save
+        self.journal_file = None # save file the journal entries are appended to, None if it needs a full save
+        self.journal_entries = 0 # number of journal entries in self.journal_file
+        self.saved_entries = set() # zip entries of self.journal_file
+        self.saved_images = set() # images declared in self.journal_file
+        self.edited_nodes = set() # IDs of the nodes and links changed since the last save
+        self.edited_links = set()
+        self.autosave = Autosave()
 
         # movement utilities
         self.drag_start = None # moved/scroll element pos when drag started
         self.drag_mouse_start = None # mouse pos when drag started
+        self.drag_links = set() # links attached to the dragged nodes, to update in the spatial index
 
         self.selection = [] # self.selection contains the list of selected objects
         self.selection_box = None # contains start position when selecting, otherwise None
+        self.box_selection = set() # nodes that would be selected by the selection box, highlighted
         self.hovered = None # hovered Graph object
         self.link = None # if link in construction, store it here, else None
 
         self.ui = UI()
 
+        # screen areas (Rect) that need to be redrawn, see Graph.invalidate
+        self.dirty = []
+        self.redraw_all = True
+        self.canvas = None # scratch surface for partial redraws
+        self.tiles = TileCache() if Graph.use_tiles else None
+        # previous state of animated or mouse-dependent elements, to know when to redraw them
+        self.last_mpos = None
+        self.link_rect = None # screen area of the link being created
+        self.box_rect = None # screen area of the selection box
+        self.ui_hovered = False
+        self.zoom_shown = False
+
         # debug information
         self.debug_surf = None
 
@@ -923,129 +2564,315 @@ class Graph:
 
         self.debug_surf.blit(font.render(text, True, Palette.text), (0, y))
 
-    def open(self, save_file):
-        """Sets self.save_file and loads save file"""
+    def open(self, save_file, background=False):
+        """Sets self.save_file and loads save file, the errors found are shown at the end. Returns True if successful.
+        If background is True, the file is loaded by a worker thread while a progress bar is displayed:
+        the objects are only used by the main thread once loaded, or the previous ones are restored."""
 
         # make a backup in case something goes wrong and the file fails to open
-        backup = [dict(Manager.nodes), dict(Manager.links), dict(Manager.images),
-                  self.scroll_x, self.scroll_y, self.zoom]
+        backup = [Manager.backup(), self.scroll_x, self.scroll_y, self.zoom]
         Manager.reset()
+        Error.collected = []
+        self.load_progress = 0
+
+        if background:
+            result = [] # stays empty if the worker thread fails
+            def load():
+                # unexpected errors would only end the thread, they are shown like the loading errors instead
+                try: result.append(self.load(save_file))
+                except Exception as e:
+                    Error.show('Unexpected error while opening the save file:\n"%s: %s"\nAborting file loading' %(type(e).__name__, e))
+            thread = Thread(target=load, daemon=True)
+            thread.start()
+            show_progress('Opening %s...' %basename(save_file), thread, lambda: self.load_progress)
+            success, journal, entries = result[0] if result else (False, [], set())
+        else:
+            success, journal, entries = self.load(save_file)
 
-        success = True
-        try:
-            lines = [] # in case there's an error and it doesn't get defined
+        if success:
+            self.open_successful(save_file)
+            self.binary = 'save.bin' in entries
+            self.journal_file = save_file
+            self.journal_entries = len(journal)
+            self.saved_entries = entries
+            self.saved_images = set(Manager.images.values())
+        else:
+            # unload the objects and restore the previous ones
+            Manager.reset()
+            manager, self.scroll_x, self.scroll_y, self.zoom = backup
+            Manager.restore(manager)
 
-            other_files = {} # file name: content
-            with ZipFile(save_file) as z:
-                lines = z.read('save.txt').decode().split('\n')
-                for file in z.filelist:
-                    file = file.filename
-                    if file != 'save.txt':
-                        other_files[file] = z.read(file)
+        Error.flush()
+        return success
 
+    def load(self, save_file):
+        """Loads the objects of a save file into the Manager, which should be empty, and the camera position.
+        Sets self.load_progress, from 0 to 1. Then, the images of the visible nodes are decoded by a pool of threads.
+        Returns (True if successful, names of the journal entries, names of all the zip entries)."""
+
+        success = True
+        journal, entries = [], set()
+        try:
+            z = ZipFile(save_file)
+            entries = set(z.namelist()) # images are only read from the zip file when used
+            image_aliases = {} # key: image ID in the file, value: ID of the image with the same pixels
+
+            # the journal entries are replayed on top of save.txt or save.bin, in order
+            snapshot = 'save.bin' if 'save.bin' in entries else 'save.txt'
+            journal = sorted(name for name in entries if name.startswith('journal/'))
+            total = sum(z.getinfo(name).file_size for name in (snapshot, *journal) if name in entries) or 1
+            done = 0 # uncompressed size of the entries already read
         except Exception as e:
             Error.zipfile(e)
             success = False
+            z = None
 
-        for y, raw in enumerate(lines):
-            # format line: remove leading and trailing spaces, double spaces, comments
-            line = ''
-            prev = ' '
-            for c in raw:
-                if c == prev == ' ': continue
-                if c == '#': break
-                line += c
-                prev = c
-            line = line.rstrip()
-            if not line: continue
+        # nodes and links are added in bulk, by batches of consecutive lines with the same command
+        bulk = {'P': (Manager.new_nodes, 5, 'wrong node values: '),
+                'L': (Manager.new_links, 3, 'wrong link values: ')}
 
-            # get command from line
-            line = line.split(' ')
-            cmd = line[0]
-            args = line[1:]
-
-            # execute action depending on command
-            match cmd:
-                case 'P': # add new node
-                    if len(args) != 5:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.new_node(*args)
-                    except:
-                        Error.corrupted_file('wrong node values: '+raw, success)
-                case 'L': # add new link
-                    if len(args) != 3:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.new_link(*args)
-                    except:
-                        Error.corrupted_file('wrong link values: '+raw, success)
-                case 'I': # add new image
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        name, id = args
-                        content = other_files[name]
-                        Manager.new_image(name, content, id)
-                    except:
-                        Error.corrupted_file('wrong image values: '+raw, success)
-                        success = False
-                case 'Ai': # attach an image to a node
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.attach_image(*args)
-                    except:
-                        Error.corrupted_file('error while attaching image: '+raw, success)
-                        success = False
-                case 'At': # attach text to a node
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.attach_text(args[0], args[1].replace('\0', ' '))
-                    except:
-                        Error.corrupted_file('error while attaching text: '+raw, success)
-                        success = False
-
-                case '_S':
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        self.scroll_x, self.scroll_y = float(args[0]), float(args[1])
-                    except:
-                        Error.corrupted_file('invalid scroll position', success)
-                case '_Z':
-                    if len(args) != 1:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        self.zoom = float(args[0])
-                    except:
-                        Error.corrupted_file('invalid zoom value', success)
-                    if not self.zoom: # forbidden value: reset zoom
-                        self.zoom = 1
-                case _:
-                    Error.syntax(y, raw)
-                    success = False
-
-            if not success: break
+        # the garbage collector would run many times while the objects are created, without anything to collect
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for entry in (snapshot, *journal) if success else ():
+                if entry == 'save.bin':
+                    success = self.load_binary(z, save_file, entries, image_aliases, Graph.parse_share*z.getinfo(entry).file_size/total)
+                    done += z.getinfo(entry).file_size
+                    if not success: break
+                    continue
+
+                # the entries are read as text streams, line by line
+                raw_stream = z.open(entry)
+                stream = TextIOWrapper(raw_stream, encoding='utf-8')
+                for cmd, lines in groupby(Graph.tokenize(stream), key=itemgetter(2)):
+                    # in the journal, nodes and links update the existing ones instead
+                    if cmd in bulk and entry == 'save.txt':
+                        add, n_args, error = bulk[cmd]
+                        while success:
+                            batch = list(islice(lines, Graph.bulk_size))
+                            if not batch: break
+                            self.load_progress = Graph.parse_share * (done + raw_stream.tell()) / total
+
+                            # a line with a wrong number of arguments stops the loading, after the lines before it
+                            n = next((k for k, line in enumerate(batch) if len(line[3]) != n_args), len(batch))
+                            for k in add([line[3] for line in batch[:n]]):
+                                Error.corrupted_file(error+batch[k][1], success)
+                            if n < len(batch):
+                                Error.syntax(*batch[n][:2])
+                                success = False
+                        if not success: break
+                        continue
+
+                    for y, raw, cmd, args in lines:
+                        if not y % Graph.bulk_size:
+                            self.load_progress = Graph.parse_share * (done + raw_stream.tell()) / total
+
+                        # execute action depending on command
+                        match cmd:
+                            case 'I': # add new image
+                                if len(args) != 2:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    name, id = args
+                                    if name not in entries: raise KeyError(name)
+                                    image_aliases.pop(int(id), None) # the ID can be reused in the journal
+                                    image = Manager.new_image(name, None, id, (save_file, name))
+                                    if image.id != int(id): image_aliases[int(id)] = image.id # same pixels
+                                except:
+                                    Error.corrupted_file('wrong image values: '+raw, success)
+                                    success = False
+                            case 'Ai': # attach an image to a node
+                                if len(args) != 2:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    Manager.attach_image(args[0], image_aliases.get(int(args[1]), args[1]))
+                                except:
+                                    Error.corrupted_file('error while attaching image: '+raw, success)
+                                    success = False
+                            case 'At': # attach text to a node
+                                if len(args) != 2:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    Manager.attach_text(args[0], args[1].replace('\0', ' '))
+                                except:
+                                    Error.corrupted_file('error while attaching text: '+raw, success)
+                                    success = False
+
+                            # journal commands
+                            case 'P': # add or update a node
+                                if len(args) != 5:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    Manager.set_node(*args)
+                                except:
+                                    Error.corrupted_file('wrong node values: '+raw, success)
+                                    success = False
+                            case 'L': # add or replace a link
+                                if len(args) != 3:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    Manager.set_link(*args)
+                                except:
+                                    Error.corrupted_file('wrong link values: '+raw, success)
+                                    success = False
+                            case 'Dp' | 'Dl': # delete a node or a link, if it was saved before
+                                if len(args) != 1:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    obj = (Manager.nodes if cmd == 'Dp' else Manager.links).get(int(args[0]))
+                                    if obj is None: pass
+                                    elif cmd == 'Dp': Manager.delete_node(obj)
+                                    else: Manager.delete_link(obj)
+                                except:
+                                    Error.corrupted_file('error while deleting object: '+raw, success)
+                                    success = False
+                            case 'Di' | 'Dt': # detach the image or the text of a node
+                                if len(args) != 1:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    if cmd == 'Di': Manager.nodes[int(args[0])].set_image(None)
+                                    else: Manager.attach_text(args[0], '')
+                                except:
+                                    Error.corrupted_file('error while detaching: '+raw, success)
+                                    success = False
+
+                            case '_S':
+                                if len(args) != 2:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    self.scroll_x, self.scroll_y = float(args[0]), float(args[1])
+                                except:
+                                    Error.corrupted_file('invalid scroll position', success)
+                            case '_Z':
+                                if len(args) != 1:
+                                    Error.syntax(y, raw)
+                                    success = False
+                                try:
+                                    self.zoom = float(args[0])
+                                except:
+                                    Error.corrupted_file('invalid zoom value', success)
+                                if not self.zoom: # forbidden value: reset zoom
+                                    self.zoom = 1
+                            case _:
+                                Error.syntax(y, raw)
+                                success = False
+
+                        if not success: break
+                    if not success: break
+
+                done += z.getinfo(entry).file_size
+                if not success: break
+        except (UnicodeDecodeError, BadZipFile, OSError, KeyError, EOFError, zlib.error) as e:
+            # the entries are decompressed and decoded while being parsed
+            Error.zipfile(e)
+            success = False
+        finally:
+            if z is not None: z.close()
+            if gc_enabled: gc.enable()
+
+        if success: self.prefetch_images()
+        self.load_progress = 1
+        return success, journal, entries
+
+    def load_binary(self, z, save_file, entries, image_aliases, share):
+        """Loads the save.bin entry of an opened save file (see BinaryFormat), returns True if successful.
+        Param image_aliases: same as in Graph.load, filled with the images that have the same pixels
+        Param share: part of self.load_progress taken by the entry"""
+        # the views of the memory map are released before closing it
+        with map_file(save_file) as memory, entry_view(z, 'save.bin', memory) as view:
+            try:
+                (self.scroll_x, self.scroll_y, self.zoom), sizes, tables, string = BinaryFormat.read(view)
+                if not self.zoom: self.zoom = 1 # forbidden value: reset zoom
+                nodes, links, images, attachments, texts = tables
+
+                # nodes and links are added in bulk
+                start, count = self.load_progress, 0
+                for add, rows, error in ((Manager.new_nodes, nodes, 'wrong node values: P %f %f %d %d %d'),
+                                         (Manager.new_links, links, 'wrong link values: L %d %d %d')):
+                    for batch in rows():
+                        for k in add(batch): Error.corrupted_file(error %batch[k], True)
+                        count += len(batch)
+                        self.load_progress = start + share * count / (sizes[0]+sizes[1])
+
+                for batch in images():
+                    for id, offset, length in batch:
+                        try:
+                            name = string(offset, length)
+                            if name not in entries: raise KeyError(name)
+                            image = Manager.new_image(name, None, id, (save_file, name))
+                            if image.id != id: image_aliases[id] = image.id # same pixels
+                        except Exception:
+                            Error.corrupted_file('wrong image values: I %d' %id, False)
+                            return False
+                for batch in attachments():
+                    for node, image in batch:
+                        try:
+                            Manager.attach_image(node, image_aliases.get(image, image))
+                        except Exception:
+                            Error.corrupted_file('error while attaching image: Ai %d %d' %(node, image), False)
+                            return False
+                for batch in texts():
+                    for node, offset, length in batch:
+                        try:
+                            Manager.attach_text(node, string(offset, length))
+                        except Exception:
+                            Error.corrupted_file('error while attaching text: At %d' %node, False)
+                            return False
+                return True
+
+            except (ValueError, struct.error) as e:
+                Error.zipfile(e)
+                return False
+
+    def prefetch_images(self):
+        """Decodes the lazy images of the nodes visible at the current camera position, by a pool of threads,
+        as they would otherwise be decoded one by one in the first frame. Sets self.load_progress up to 1."""
+        if self.lod(): return # no images drawn
+
+        nodes = Manager.grid.nodes_in_rect(*self.view_rect(Node.rank_sizes[-1]/2))
+        images = list({node.image for node in nodes if node.image is not None and node.image._surf is None})
+        if not images: return
+
+        # the zip entries are read first, one at a time, as views of the save file
+        contents = []
+        for image in images:
+            try: contents.append(Image.read(*image.source))
+            except Exception: contents.append(None)
+
+        def decode(content):
+            try: return Image.decode(content)
+            except Exception: return None # replaced by an empty image when used
+
+        # pygame releases the GIL while decoding the images
+        start = self.load_progress
+        with ThreadPoolExecutor() as pool:
+            for i, (image, surf) in enumerate(zip(images, pool.map(decode, contents))):
+                if surf is not None:
+                    image._surf = surf
+                    Image.track(image)
+                self.load_progress = start + (1-start) * (i+1) / len(images)
+        Image.drop_pages()
 
-        if success:
-            self.open_successful(save_file)
-            for d in backup: del d
-        else:
-            # unload the objects and restore the previous ones
-            # manually deleting makes for less memory usage
-            del Manager.links
-            del Manager.images
-            del Manager.nodes # nodes last because then they no longer have any references
-            Manager.nodes, Manager.links, Manager.images, self.scroll_x, self.scroll_y, self.zoom = backup
+    @staticmethod
+    def tokenize(stream):
+        """Yields (line index, raw line, command, arguments) for the lines of a save.txt text stream that aren't empty.
+        Comments, leading and trailing spaces, and double spaces are removed."""
+        for y, raw in enumerate(stream):
+            raw = raw.rstrip('\n')
+            line = raw.split('#', 1)[0].rstrip() if '#' in raw else raw.rstrip()
+            if not line: continue
+            args = line.split(' ')
+            if '' in args: args = [arg for arg in args if arg]
+            yield y, raw, args[0], args[1:]
 
     def open_successful(self, save_file):
         """If opening a file was successful, prepare graph (reset variables)"""
@@ -1059,70 +2886,160 @@ class Graph:
         self.hovered_l = None
         self.link = None
         self.changes = False
+        self.binary = Graph.binary_format
+        self.journal_file = None
+        self.edited_nodes = set()
+        self.edited_links = set()
+        self.autosave.cancel()
+        if self.tiles is not None: self.tiles = TileCache()
         set_title(save_file, False)
         self.ui.update_surf()
 
     def save(self):
-        """Saves graph contents into self.save_file"""
+        """Saves graph contents into self.save_file.
+        If Graph.incremental is set and the file was already opened or saved, only the changes since then are
+        appended to it, as a journal entry. Otherwise, or after Graph.journal_limit entries, the whole file is
+        rewritten with Graph.compact."""
 
         if self.save_file is None: raise ValueError('No save loaded')
+        if not Graph.incremental or self.journal_file != self.save_file or not exists(self.save_file) \
+                or self.journal_entries >= Graph.journal_limit:
+            self.compact()
+            return
+
+        # general information, always written
+        content = ['_S %f %f' %(self.scroll_x, self.scroll_y),
+                   '_Z %f' %(self.zoom)]
+
+        # deleted objects, the links being created are not saved
+        links = {id: Manager.links.get(id) for id in sorted(self.edited_links)}
+        nodes = {id: Manager.nodes.get(id) for id in sorted(self.edited_nodes)}
+        content += ['Dl %d' %id for id, link in links.items() if link is None or link.n2 is None]
+        content += ['Dp %d' %id for id, node in nodes.items() if node is None]
+
+        # created or changed objects
+        nodes = [node for node in nodes.values() if node is not None]
+        links = [link for link in links.values() if link is not None and link.n2 is not None]
+        content += ['P %f %f %d %d %d' %(node.x, node.y, node.rank, node.state, node.id) for node in nodes]
+        content += ['L %d %d %d' %(link.n1.id, link.n2.id, link.id) for link in links]
+
+        # images not declared in the file yet, their entries are only written if no image has the same pixels
+        images = {} # key: entry name, value: content
+        new_images = {node.image for node in nodes if node.image is not None} - self.saved_images
+        for image in sorted(new_images, key=attrgetter('id')):
+            content.append('I %s %d' %(image.entry(), image.id))
+            if image.entry() not in self.saved_entries: images[image.entry()] = image.encode()
+
+        # attachments, replaced as a whole
+        for node in nodes:
+            content.append('Ai %d %d' %(node.id, node.image.id) if node.image is not None else 'Di %d' %node.id)
+        for node in nodes:
+            content.append('At %d %s' %(node.id, node.text.replace(' ', '\0')) if node.text else 'Dt %d' %node.id)
+
+        # the open lazy images file is closed before appending to it
+        Image.close()
+        entry = 'journal/%06d.txt' %(self.journal_entries+1)
+        with self.autosave.lock, ZipFile(self.save_file, 'a', ZIP_DEFLATED, compresslevel=Graph.compress_level) as z:
+            for name, data in images.items():
+                z.writestr(name, data, ZIP_STORED)
+            z.writestr(entry, '\n'.join(content)+'\n')
+
+        self.journal_entries += 1
+        self.saved_entries.update(images, (entry,))
+        self.saved_images |= new_images
+        self.edited_nodes = set()
+        self.edited_links = set()
+        self.changes = False
+        self.autosave.discard(self.save_file)
+        set_title(self.save_file)
+
+    def compact(self):
+        """Saves graph contents into self.save_file, rewriting it as a whole: the journal of the file is folded
+        into a new snapshot of the graph"""
+
+        if self.save_file is None: raise ValueError('No save loaded')
+
+        # images, only the ones used in the graph are saved
+        used_images = {node.image for node in Manager.nodes.values() if node.image is not None}
+        name, serialize = ('save.bin', BinaryFormat.pack) if self.binary else ('save.txt', Graph.serialize)
+        content = serialize(self.scroll_x, self.scroll_y, self.zoom,
+                            [(id, node.x, node.y, node.rank, node.state, node.text, node.image) for id, node in Manager.nodes.items()],
+                            [(id, link.n1.id, link.n2.id) for id, link in Manager.links.items() if link.n2 is not None],
+                            {image: image.entry() for image in Manager.images.values() if image in used_images})
+
+        # the zip entries of the lazy images are read before the save file is overwritten,
+        # and the unused images read from it are fully loaded, as they won't be in it anymore
+        images = {} # key: entry name, value: content, images with the same pixels are written once
+        for image in used_images:
+            if image.entry() not in images: images[image.entry()] = image.encode()
+        for image in Manager.images.values():
+            if image not in used_images and image.source is not None and image.source[0] == self.save_file:
+                image.loaded()
+        Image.close()
+
+        # save into zip file, the images are already compressed
+        with self.autosave.lock, ZipFile(self.save_file, 'w', ZIP_DEFLATED, compresslevel=Graph.compress_level) as z:
+            # add the main save file into the zip file, save.bin is not compressed to be memory-mapped
+            z.writestr(name, content, ZIP_STORED if self.binary else ZIP_DEFLATED)
+
+            # add the images as PNG files
+            for entry, data in images.items():
+                z.writestr(entry, data, ZIP_STORED)
+
+        # the lazy images are now read from their new entries
+        for image in used_images:
+            if image.source is not None: image.source = self.save_file, image.entry()
+
+        self.journal_file = self.save_file
+        self.journal_entries = 0
+        self.saved_entries = {name, *images}
+        self.saved_images = used_images
+        self.edited_nodes = set()
+        self.edited_links = set()
+        self.changes = False
+        self.autosave.discard(self.save_file)
+        set_title(self.save_file)
+
+    @staticmethod
+    def serialize(scroll_x, scroll_y, zoom, nodes, links, entries):
+        """Returns the content of the save.txt entry of a save file
+        Param nodes: list of (id, x, y, rank, state, text, image) rows, image being an Image or None
+        Param links: list of (id, n1 ID, n2 ID) rows
+        Param entries: dict key: image used by the nodes, value: name of its zip entry"""
 
         # general information
         content = ['# GENERAL INFO',
-                   '_S %f %f' %(self.scroll_x, self.scroll_y),
-                   '_Z %f' %(self.zoom)]
+                   '_S %f %f' %(scroll_x, scroll_y),
+                   '_Z %f' %(zoom)]
 
         # nodess
         content += ('', '# NODES')
-        for id, node in Manager.nodes.items():
-            content.append('P %f %f %d %d %d' %(node.x, node.y, node.rank, node.state, id))
+        for id, x, y, rank, state, text, image in nodes:
+            content.append('P %f %f %d %d %d' %(x, y, rank, state, id))
 
         # links
         content += ('', '# LINKS')
-        for id, link in Manager.links.items():
-            content.append('L %d %d %d' %(link.n1.id, link.n2.id, id))
+        for id, n1, n2 in links:
+            content.append('L %d %d %d' %(n1, n2, id))
 
         # images
         content += ('', '# IMAGES')
-        for id, image in Manager.images.items():
-            # check if this image is used in the graph, otherwise don't save it
-            used = False
-            for node in Manager.nodes.values():
-                if node.image == image:
-                    used = True
-                    break
-
-            if used:
-                content.append('I %s %d' %(image.path, image.id))
+        for image, name in entries.items():
+            content.append('I %s %d' %(name, image.id))
 
         # images attached to nodes
         content += ('', '# LINK IMAGES')
-        used_image_ids = []
-        for id, node in Manager.nodes.items():
-            if node.image is not None:
-                content.append('Ai %d %d' %(id, node.image.id))
-                used_image_ids.append(node.image.id)
+        for id, x, y, rank, state, text, image in nodes:
+            if image is not None:
+                content.append('Ai %d %d' %(id, image.id))
 
         # text attached to nodes
         content += ('', '# TEXT')
-        for id, node in Manager.nodes.items():
-            if node.text:
-                content.append('At %d %s' %(id, node.text.replace(' ', '\0')))
-
-        # save into zip file
-        with ZipFile(self.save_file, 'w') as z:
-            # add the main save file into the zip file
-            z.writestr('save.txt', '\n'.join(content)+'\n')
-
-            # encode the width, height and image data into image files
-            for id in set(used_image_ids):
-                image = Manager.images[id]
-                w, h = image.surf.get_size()
-                content = b'%d.%d.%s' %(w, h, pygame.image.tostring(image.surf, 'RGBA'))
-                z.writestr(image.path, content)
+        for id, x, y, rank, state, text, image in nodes:
+            if text:
+                content.append('At %d %s' %(id, text.replace(' ', '\0')))
 
-        self.changes = False
-        set_title(self.save_file)
+        return '\n'.join(content)+'\n'
 
     def newfile(self):
         Manager.reset()
@@ -1134,17 +3051,24 @@ class Graph:
             self.save_file = file
             self.save()
 
+    def convert(self, save_file, new_file, binary=None):
+        """Rewrites a save file into new_file, in the binary format (see BinaryFormat) if binary is True,
+        in the text format if it is False, or in the other format than the one of save_file if it is None.
+        The converted file stays opened, returns True if successful."""
+        if not self.open(save_file): return False
+        self.binary = not self.binary if binary is None else binary
+        self.save_file = new_file
+        self.compact()
+        return True
+
     def export(self, transparent):
-        """Exports the graph into a png image, either with Palette.background background or no background.
-        The render is done at zoom 1, and a margin of 20px is added around the graph.
-        There needs to be at least one element in the graph for it to be rendered.
-        Very large graphs might MemoryError, might have to export to another zoom. TODO?
-        For now, it just raises an error."""
+        """Asks for a file and exports the graph into it as a png image, see Graph.export_file"""
 
         if not len(Manager.nodes):
             ask_button('Cannot render an empty graph.', [(0, 'OK')])
             return
 
+        from tkinter.filedialog import asksaveasfilename # only needed by the editor
         if self.save_file is None: file = None
         else: file = splitext(basename(self.save_file))[0]+'.png'
         file = asksaveasfilename(title='Export to file', filetypes=(('PNG files', '.png'),), initialfile=file)
@@ -1158,8 +3082,30 @@ class Graph:
         screen.blit(background, (0, 0))
         pygame.display.flip()
 
-        # get the bounding boxes
+        try:
+            self.export_file(file, transparent)
+        except MemoryError:
+            ask_button('A MemoryError occured.\nMaybe try to lower the size of your graph.', [(0, 'OK')])
+        except (OSError, pygame.error) as e:
+            ask_button('Could not export the graph:\n"%s"' %e, [(0, 'OK')])
+
+        # reset the screen to as it was before for safety
+        screen.blit(old_screen, (0, 0))
+        pygame.display.flip()
+
+    def export_file(self, file, transparent):
+        """Exports the graph into a png image, either with Palette.background background or no background.
+        The render is done at zoom 1, and a margin of 40px is added around the graph.
+        Does not need a display, raises ValueError if the graph is empty.
+        The image is rendered by bands of Graph.export_tile rows, split into square tiles to only draw the nodes
+        around them, and written to the file band by band (see PngWriter): the memory taken is bound by the width
+        of the image, not by its size."""
+
+        if not len(Manager.nodes): raise ValueError('Cannot render an empty graph')
+
+        # get the bounding boxes, and the largest extents of the nodes around their center to find them from the tiles
         x0 = y0 = x1 = y1 = None
+        mx = mtop = mbtm = 0
         for node in Manager.nodes.values():
             if node.text_surfs is None: w = h = 0
             else: w, h = node.text_surfs[1].get_size()
@@ -1172,31 +3118,47 @@ class Graph:
             if y0 is None or node.y-offsettop < y0: y0 = node.y-offsettop
             if x1 is None or node.x+offsetx > x1: x1 = node.x+offsetx
             if y1 is None or node.y+offsetbtm > y1: y1 = node.y+offsetbtm
+            mx, mtop, mbtm = max(mx, offsetx), max(mtop, offsettop), max(mbtm, offsetbtm)
 
-        w, h = (x1-x0)*Graph.unit_size, (y1-y0)*Graph.unit_size
+        width, height = int((x1-x0)*Graph.unit_size + 80), int((y1-y0)*Graph.unit_size + 80)
+        size = Graph.export_tile
+        ml = Link.rank_sizes[-1]/2/Graph.unit_size
+        # the bands are rendered with the nodes above them, as pygame rounds the negative positions differently:
+        # all positions are then positive, and the nodes are drawn exactly as on a surface of the whole image
+        margin = int((mtop+mbtm)*Graph.unit_size) + 1
 
+        png = PngWriter(file, width, height)
         try:
-            surf = pygame.Surface((w+80, h+80), SRCALPHA)
-        except MemoryError:
-            ask_button('A MemoryError occured.\nMaybe try to lower the size of your graph.', [(0, 'OK')])
-            return
-
-        if not transparent:
-            surf.fill(Palette.background)
-
-        # add all objects: make a custom projector for this surface
-        project = lambda x, y: ((x-x0)*Graph.unit_size + 40, (y-y0)*Graph.unit_size + 40)
-
-        for link in Manager.links.values():
-            link.update([], surf, project)
-        for node in Manager.nodes.values():
-            node.update([], surf, project, True)
-
-        pygame.image.save(surf, file)
-
-        # reset the screen to as it was before for safety
-        screen.blit(old_screen, (0, 0))
-        pygame.display.flip()
+            for by in range(0, height, size):
+                bh = min(size, height-by)
+                band = pygame.Surface((width, margin+bh), SRCALPHA)
+                if not transparent:
+                    band.fill(Palette.background)
+
+                # custom projector for this band, the rows of the image start at margin
+                project = lambda x, y: ((x-x0)*Graph.unit_size + 40, (y-y0)*Graph.unit_size + 40 - by + margin)
+                wy0, wy1 = (by-40)/Graph.unit_size + y0, (by+bh-40)/Graph.unit_size + y0
+
+                # links of the whole band, as the lines cut by the borders of the surface shift slightly
+                band.set_clip(Rect(0, margin, width, bh))
+                links = Manager.grid.query((x0-ml, wy0-ml, x1+ml, wy1+ml), get_nodes=False)[1]
+                Link.draw_all(sorted(links, key=attrgetter('id')), band, project, zoom=1)
+
+                # nodes of each tile
+                for bx in range(0, width, size):
+                    band.set_clip(Rect(bx, margin, min(size, width-bx), bh))
+                    wx0, wx1 = (bx-40)/Graph.unit_size + x0, (bx+size-40)/Graph.unit_size + x0
+                    nodes = Manager.grid.nodes_in_rect(wx0-mx, wy0-mbtm, wx1+mx, wy1+mtop)
+                    for node in sorted(nodes, key=Node.draw_order):
+                        node.update([], band, project, True, zoom=1)
+
+                png.write(band.subsurface(Rect(0, margin, width, bh)))
+            png.close()
+        except BaseException:
+            # do not leave a truncated image
+            png.file.close()
+            os.remove(file)
+            raise
 
     def project(self, x, y):
         """Returns the position, in screen coordinates, corresponding to a position in graph coordinates"""
@@ -1208,6 +3170,142 @@ class Graph:
         z = self.zoom * Graph.unit_size
         return (x - self.W/2) / z + self.scroll_x, (y - self.H/2) / z + self.scroll_y
 
+    def view_rect(self, margin=0):
+        """Returns the rectangle (x0, y0, x1, y1) in graph coordinates that is visible on the screen,
+        extended by margin pixels on each side"""
+        x0, y0 = self.screen2coord(-margin, -margin)
+        x1, y1 = self.screen2coord(self.W+margin, self.H+margin)
+        return x0, y0, x1, y1
+
+    def nodes_in_box(self, pos0, pos1):
+        """Returns the list of nodes whose center is in the box between the screen positions pos0 and pos1.
+        Uses a range query in graph coordinates, vectorized if NumPy is available."""
+        x0, y0 = self.screen2coord(*pos0)
+        x1, y1 = self.screen2coord(*pos1)
+        if x1 < x0: x0, x1 = x1, x0
+        if y1 < y0: y0, y1 = y1, y0
+
+        if Manager.store is not None: return Manager.store.in_rect(x0, y0, x1, y1)
+        return Manager.grid.nodes_in_rect(x0, y0, x1, y1)
+
+    def get_visible(self, region=None, get_nodes=True):
+        """Returns the lists of the visible nodes and links, in display order.
+        If region is set, only the objects around this screen Rect are returned, without exact visibility checks.
+        If get_nodes is False, the returned list of nodes is empty."""
+
+        if region is not None:
+            # the node margin also accounts for the node texts, displayed under them
+            rect = lambda margin: (*self.screen2coord(region.left-margin, region.top-margin),
+                                   *self.screen2coord(region.right+margin, region.bottom+margin))
+            nodes, links = Manager.grid.query(rect(Node.rank_sizes[-1]/2 + Graph.text_margin), rect(Link.rank_sizes[-1]/2),
+                                              get_nodes)
+            visible_n = sorted(nodes, key=Node.draw_order)
+        else:
+            # get visible graph objects from the spatial index, the margins account for the objects size
+            # with NumPy, the visible nodes are found with vectorized operations on all the nodes instead
+            store = Manager.store
+            nodes, links = Manager.grid.query(self.view_rect(Node.rank_sizes[-1]/2), self.view_rect(Link.rank_sizes[-1]/2),
+                                              get_nodes and store is None)
+            # node objects that are visible, in display order to have the more important ones on top
+            if not get_nodes:
+                visible_n = []
+            elif store is not None:
+                visible_n = store.visible(self)
+            elif 4*len(nodes) > len(Manager.draw_order):
+                # most nodes are around the screen: filtering the display order is faster than sorting
+                visible_n = [node for node in Manager.draw_order if node in nodes and node.visible()]
+            else:
+                visible_n = sorted((node for node in nodes if node.visible()), key=Node.draw_order)
+
+        visible_l = sorted(links, key=lambda link: link.id) # same for links
+        if self.link is not None: visible_l.append(self.link)
+        return visible_n, visible_l
+
+    def lod(self):
+        """Returns the current level of detail, from 0 (full detail) to 3 (density cells), see Graph.lod_zooms"""
+        return sum(self.zoom < zoom for zoom in Graph.lod_zooms)
+
+    def draw_density(self, surf, nodes):
+        """Draws the nodes aggregated into density cells, colored depending on their states.
+        Param nodes: list of the visible nodes, unused if NumPy is available"""
+        cell = Graph.density_cell
+        if Manager.store is not None:
+            cells = Manager.store.density(self, cell)
+        else:
+            cells = {}
+            for node in nodes:
+                x, y = self.project(node.x, node.y)
+                key = (int(x//cell), int(y//cell))
+                counts = cells.get(key)
+                if counts is None: counts = cells[key] = [0, 0, 0]
+                counts[node.state] += 1
+
+        # color: average of the states colors, brighter with more nodes
+        (r0, g0, b0), (r1, g1, b1), (r2, g2, b2) = Palette.states
+        for (cx, cy), (n0, n1, n2) in cells.items():
+            total = n0 + n1 + n2
+            k = min(0.3 + 0.1*total, 1) / total
+            col = ((r0*n0 + r1*n1 + r2*n2) * k, (g0*n0 + g1*n1 + g2*n2) * k, (b0*n0 + b1*n1 + b2*n2) * k)
+            surf.fill(col, (cx*cell, cy*cell, cell, cell))
+
+        # keep the hovered and selected nodes visible
+        for node in self.selection + [self.hovered]:
+            if type(node) == Node: node.update([], surf, self.project, lod=2)
+
+    def edited(self, *objs, links=False):
+        """Marks graph objects as changed, to render again the cached tiles containing them,
+        and to write them in the next journal entry (see Graph.save).
+        If links is True, the links attached to the given nodes are also marked."""
+        if links:
+            objs += tuple(link for obj in objs if type(obj) == Node for link in Manager.node_links.get(obj, ()))
+        for obj in objs:
+            if type(obj) == Node: self.edited_nodes.add(obj.id)
+            else: self.edited_links.add(obj.id)
+            if self.tiles is not None: self.tiles.invalidate_object(obj)
+        self.autosave.edited(objs)
+
+    def invalidate(self, rect=None):
+        """Marks a screen Rect as needing to be redrawn, or the whole screen if rect is None"""
+        if rect is None: self.redraw_all = True
+        else: self.dirty.append(rect)
+
+    def invalidate_object(self, obj):
+        """Marks the screen area of a graph object as needing to be redrawn. obj can be None."""
+        if obj is not None: self.invalidate(self.object_rect(obj))
+
+    def object_rect(self, obj):
+        """Returns the screen Rect covered by a graph object, including the texts of nodes"""
+        if type(obj) == Node:
+            x, y = self.project(obj.x, obj.y)
+            s = obj.size if self.zoom > 1 else obj.size*self.zoom
+            rect = Rect(x - s/2, y - s/2, s, s)
+
+            if obj.text_surfs is not None:
+                for text in obj.text_surfs:
+                    w, h = text.get_size()
+                    rect.union_ip(Rect(x - w/2, y + s/2 + 5, w, h))
+        else:
+            x1, y1 = self.project(obj.n1.x, obj.n1.y)
+            x2, y2 = pygame.mouse.get_pos() if obj.n2 is None else self.project(obj.n2.x, obj.n2.y)
+            r = obj.size
+            rect = Rect(min(x1, x2) - r, min(y1, y2) - r, abs(x2-x1) + 2*r, abs(y2-y1) + 2*r)
+
+        return rect.inflate(4, 4)
+
+    def animating(self):
+        """Returns True if the screen needs to be updated even without new events"""
+        return self.ui.animating() or self.autosave.copying()
+
+    def object_at(self, pos):
+        """Returns the object at the position pos in screen coordinates, or None.
+        Nodes have priority over links, and links can't be hovered while creating a link."""
+        x, y = self.screen2coord(*pos)
+        scale = 1/self.zoom/Graph.unit_size
+
+        node = Manager.grid.node_at(x, y, scale)
+        if node is not None or self.link is not None: return node
+        return Manager.grid.link_at(x, y, scale)
+
     def select(self, obj):
         """Sets self.selection to obj and updates self.ui"""
         self.selection = [] if obj is None else [obj]
@@ -1219,26 +3317,12 @@ class Graph:
         pressed = pygame.mouse.get_pressed()[0]
         mpos = pygame.mouse.get_pos()
 
-        # get visible graph objects now, useful for collision checks
-        visible_n = [] # node objects that are visible
-        for node in Manager.nodes.values():
-            if node.visible():
-                visible_n.append(node)
-        visible_l = [] # same for links
-        for link in Manager.links.values():
-            if link.n1 in visible_n or link.n2 in visible_n or link.n2 is None:
-                visible_l.append(link)
-
-        self.hovered = None
-        for node in visible_n:
-            if node.collide(mpos):
-                self.hovered = node
-                break
-        for link in visible_l:
-            # don't select a link if something else has been selected,
-            # or if currently creating a link
-            if self.hovered is not None or self.link is not None: break
-            if link.collide(mpos): self.hovered = link
+        # hovered object, the old and new ones need to be redrawn if it changed
+        hovered = self.object_at(mpos)
+        if hovered is not self.hovered:
+            self.invalidate_object(self.hovered)
+            self.invalidate_object(hovered)
+            self.hovered = hovered
 
         change = False # did the user do a change this frame?
         change_zoom = False # did the zoom change this frame?
@@ -1258,6 +3342,8 @@ class Graph:
                     self.drag_start = (self.scroll_x, self.scroll_y)
                 elif type(self.selection[0]) == Node:
                     self.drag_start = (self.selection[0].x, self.selection[0].y)
+                    self.drag_links = set()
+                    for node in self.selection: self.drag_links.update(Manager.node_links.get(node, ()))
 
                 if not len(self.selection) or type(self.selection[0]) == Node:
                     self.drag_mouse_start = event.pos
@@ -1265,16 +3351,9 @@ class Graph:
                 # finish adding a link
                 if len(self.selection) and type(self.selection[0]) == Node and self.link is not None and self.link.n1 != self.selection[0]:
                     # check if no link exists between these two nodes
-                    ok = True
-                    for link in Manager.links.values():
-                        if (link.n1 == self.link.n1 and link.n2 == self.selection[0]) or \
-                            (link.n2 == self.link.n1 and link.n1 == self.selection[0]):
-                            ok = False
-                            break
-
-                    if ok:
-                        self.link.n2 = self.selection[0]
-                        self.link.refresh()
+                    if Manager.get_link(self.link.n1, self.selection[0]) is None:
+                        Manager.finish_link(self.link, self.selection[0])
+                        self.edited(self.link)
                         self.link = None
                         self.select(None)
                         self.drag_start = None # prevent unwanted drag
@@ -1290,18 +3369,13 @@ class Graph:
             elif event.type == MOUSEBUTTONUP and event.button == 1:
                 self.drag_start = None
                 self.drag_mouse_start = None
+                self.drag_links = set()
 
             elif event.type == MOUSEBUTTONUP and event.button == 3:
-                x0, y0 = self.selection_box
-                x1, y1 = event.pos
-                if x1 < x0: x0, x1 = x1, x0
-                if y1 < y0: y0, y1 = y1, y0
+                if self.selection_box is None: continue
+                self.selection = self.nodes_in_box(self.selection_box, event.pos)
                 self.selection_box = None
-                self.selection = []
-                for node in Manager.nodes.values():
-                    x, y = self.project(node.x, node.y)
-                    if x0 <= x <= x1 and y0 <= y <= y1:
-                        self.selection.append(node)
+                self.box_selection = set()
 
             # zoom
             elif event.type == MOUSEWHEEL and not pressed:
@@ -1337,7 +3411,7 @@ class Graph:
                         self.select(None)
                     else:
                         # or undo the creation of a new link
-                        del Manager.links[self.link.id]
+                        Manager.delete_link(self.link)
                         self.link = None
 
                 elif event.key == K_RETURN and self.link is None:
@@ -1346,6 +3420,7 @@ class Graph:
                 elif not len(self.selection):
                     if event.key == K_p:
                         self.select(Manager.new_node(*self.screen2coord(*mpos), 0, 0))
+                        self.edited(self.selection[0])
                         change = True
                     elif event.key == K_s:
                         if self.save_file is None: self.saveas()
@@ -1358,7 +3433,7 @@ class Graph:
                     elif event.key == K_o:
                         if not self.changes or want_to_save() is not None:
                             path = ask_filename()
-                            if path != '': self.open(path)
+                            if path != '': self.open(path, True)
                     elif event.key == K_i:
                         import_image()
                     elif event.key == K_e:
@@ -1375,34 +3450,33 @@ class Graph:
                         image = image_selector()
                         if image is not None:
                             node.set_image(image)
+                            self.edited(node)
                             change = True
                     elif event.key == K_t:
                         check = lambda s: '\n' not in s and '\r' not in s and '\t' not in s
                         text = ask_input_box('Enter node text:', str, check, self.W-20, node.text)
                         if text is not None:
                             node.set_text(text)
+                            self.edited(node)
                             change = True
                     elif event.key == K_r:
                         node.cycle_rank()
+                        self.edited(node, links=True)
                         change = True
                     elif event.key == K_s:
                         node.cycle_state()
+                        self.edited(node, links=True)
                         change = True
                     elif event.key == K_DELETE:
+                        self.edited(*self.selection, links=True)
                         if node.image is not None:
                             node.set_image(None)
                         elif node.text:
                             node.set_text('')
                         else:
-                            to_delete = [] # links that connect to the deleted nodes
+                            # also deletes the links that connect to the deleted nodes
                             for node in self.selection:
-                                for id, link in Manager.links.items():
-                                    if link.n1 == node or link.n2 == node:
-                                        to_delete.append(id)
-                                del Manager.nodes[node.id]
-                            for link in to_delete:
-                                if link in Manager.links:
-                                    del Manager.links[link]
+                                Manager.delete_node(node)
                             # this value will be overwritten, self.selection should never be None
                             self.selection = [None]
                         self.select(self.selection[0]) # update self.ui
@@ -1410,7 +3484,8 @@ class Graph:
 
                 elif type(self.selection[0]) == Link:
                     if event.key == K_DELETE:
-                        del Manager.links[self.selection[0].id]
+                        self.edited(self.selection[0])
+                        Manager.delete_link(self.selection[0])
                         self.select(None)
                         change = True
 
@@ -1421,10 +3496,15 @@ class Graph:
             m = 1/self.zoom/self.unit_size
             dx = (x0-x1) * m
             dy = (y0-y1) * m
-            if len(self.selection):
+            # the other selected nodes move with the first one, nothing changes while the mouse stays still
+            if len(self.selection) and (x-dx, y-dy) != (self.selection[0].x, self.selection[0].y):
+                self.edited(*self.selection, *self.drag_links) # old positions
                 for obj in reversed(self.selection):
-                    obj.x = x + obj.x - self.selection[0].x - dx
-                    obj.y = y + obj.y - self.selection[0].y - dy
+                    Manager.move_node(obj, x + obj.x - self.selection[0].x - dx,
+                                           y + obj.y - self.selection[0].y - dy)
+                for link in self.drag_links:
+                    Manager.grid.update_link(link)
+                self.edited(*self.selection, *self.drag_links)
             else:
                 self.scroll_x = x + dx
                 self.scroll_y = y + dy
@@ -1433,15 +3513,97 @@ class Graph:
         if change:
             self.changes = True
             set_title(self.save_file, True)
+        self.autosave.update(self)
 
-        screen.fill(Palette.background)
+        # find what needs to be redrawn: everything after any input other than a mouse movement,
+        # or when dragging, otherwise only the areas that changed
+        moved = mpos != self.last_mpos
+        self.last_mpos = mpos
+        if any(event.type != MOUSEMOTION for event in events) or (self.drag_start is not None and moved):
+            self.invalidate()
+
+        # highlight the nodes that the selection box would select
+        box_rect = None
+        if self.selection_box is not None:
+            box_selection = set(self.nodes_in_box(self.selection_box, mpos))
+            for node in box_selection ^ self.box_selection: self.invalidate_object(node)
+            self.box_selection = box_selection
+
+            x0, y0 = self.selection_box
+            box_rect = Rect(min(x0, mpos[0]), min(y0, mpos[1]), abs(mpos[0]-x0), abs(mpos[1]-y0))
+        if box_rect != self.box_rect:
+            for rect in (box_rect, self.box_rect):
+                if rect is not None: self.invalidate(rect)
+            self.box_rect = box_rect
+
+        # the link being created follows the mouse
+        link_rect = None if self.link is None else self.object_rect(self.link)
+        if link_rect != self.link_rect:
+            for rect in (link_rect, self.link_rect):
+                if rect is not None: self.invalidate(rect)
+            self.link_rect = link_rect
+
+        # UI: transparency of the top bar, zoom indicator
+        ui_hovered = self.ui.hovered()
+        if ui_hovered != self.ui_hovered:
+            self.invalidate(self.ui.bar_rect())
+            self.ui_hovered = ui_hovered
+        zoom_shown = self.ui.animating()
+        if zoom_shown or self.zoom_shown:
+            self.invalidate(self.ui.zoom_rect())
+        self.zoom_shown = zoom_shown
+
+        if self.debug_surf is not None: self.invalidate()
+
+        return self.render(events, mpos, change_zoom)
+
+    def render(self, events, mpos, change_zoom):
+        """Redraws the areas marked with Graph.invalidate, and returns the list of updated screen Rects"""
+
+        screen_rect = Rect(0, 0, Graph.W, Graph.H)
+        if self.redraw_all: dirty = [screen_rect]
+        else: dirty = [rect.clip(screen_rect) for rect in self.dirty]
+        dirty = [rect for rect in dirty if rect.w and rect.h]
+        self.dirty = []
+        self.redraw_all = False
+        if not dirty: return dirty
+
+        # redraw the smallest area containing all dirty Rects
+        region = dirty[0].unionall(dirty[1:])
+        if region == screen_rect: Image.frame += 1 # images drawn from now on are on screen
+        lod = self.lod()
+        get_nodes = lod < 3 or Manager.store is None # the density cells are computed from the NumPy arrays
+        # when panning, the screen is made of cached tiles, only the hovered and selected objects are drawn live
+        use_tiles = self.tiles is not None and lod < 3 and region == screen_rect and \
+                    self.drag_start is not None and not self.selection
+        if use_tiles:
+            surf = screen
+            overlay = [obj for obj in (self.hovered, *self.selection, *self.box_selection, self.link) if obj is not None]
+            visible_l = [obj for obj in overlay if type(obj) == Link]
+            visible_n = sorted((obj for obj in overlay if type(obj) == Node), key=Node.draw_order)
+        elif region == screen_rect:
+            surf = screen
+            visible_n, visible_l = self.get_visible(None, get_nodes)
+        else:
+            # draw onto a scratch surface instead of clipping the drawing to the region, as pygame draws
+            # clipped thick lines slightly differently. Only the region is then copied, as objects
+            # around it are not redrawn and the scratch surface is wrong outside of it.
+            if self.canvas is None or self.canvas.get_size() != screen.get_size():
+                self.canvas = pygame.Surface(screen.get_size())
+            surf = self.canvas
+            visible_n, visible_l = self.get_visible(region, get_nodes)
+
+        if use_tiles: self.tiles.draw(surf, self)
+        else: surf.fill(Palette.background, region)
 
         # update and render graph objects
-        for link in visible_l: link.update(events, screen, self.project)
-        for node in visible_n: node.update(events, screen, self.project)
+        Link.draw_all(visible_l, surf, self.project, lod)
+        if lod == 3: self.draw_density(surf, visible_n)
+        else:
+            for node in visible_n: node.update(events, surf, self.project, lod=lod)
 
         # update and render menu and UI
-        self.ui.update(change_zoom)
+        self.ui.update(change_zoom, surf)
 
         # display selection box if needed
         if self.selection_box is not None:
@@ -1450,17 +3612,21 @@ class Graph:
             if x1 < x0: x0, x1 = x1, x0
             if y1 < y0: y0, y1 = y1, y0
             dx, dy = x1-x0, y1-y0
-            surf = pygame.Surface((dx, dy), SRCALPHA)
-            surf.fill(Palette.selection_outline)
-            pygame.draw.rect(surf, Palette.selection_fill, Rect(1, 1, dx-2, dy-2))
+            box = pygame.Surface((dx, dy), SRCALPHA)
+            box.fill(Palette.selection_outline)
+            pygame.draw.rect(box, Palette.selection_fill, Rect(1, 1, dx-2, dy-2))
 
-            screen.blit(surf, (x0, y0))
+            surf.blit(box, (x0, y0))
 
         # display debug screen if needed
         if self.debug_surf is not None:
-            screen.blit(self.debug_surf, (0, 0))
+            surf.blit(self.debug_surf, (0, 0))
             self.debug_surf = None
 
+        if surf is not screen: screen.blit(surf, region, region)
+        Image.evict() # the images drawn in this frame are kept
+        return dirty
+
 def set_title(name, unsaved=False):
     """Sets the title of the pygame application"""
 
@@ -1486,15 +3652,94 @@ def quit_app():
 
     if res is None: return
     if res == 0: graph.save()
+    graph.autosave.discard(graph.save_file) # the changes are either saved or abandoned
     run = False
     return True
 
-_FPS = 60 # actually used FPS will be based on this value
+def editor(save_file=None):
+    """Runs the application, optionally opening a save file, until the window is closed"""
+    global run
+
+    if save_file is not None: graph.open(save_file, True)
+    else: graph.autosave.recover(graph)
+
+    run = True
+    while run:
+        # pygame event loop, waits for an event when there is nothing to animate, to not use the CPU when idle
+        if graph.animating(): events = pygame.event.get()
+        else: events = [pygame.event.wait(1000)] + pygame.event.get()
+        events = [event for event in events if event.type != NOEVENT]
+
+        for event in events:
+            if event.type == QUIT:
+                quit_app()
+            elif event.type == VIDEORESIZE:
+                graph.resize()
+
+        # only update the parts of the screen that were redrawn
+        rects = graph.update(events)
+        if rects: pygame.display.update(rects)
+        clock.tick(FPS)
+
+    pygame.quit()
+
+def export_command(save_file, image_file, transparent=False):
+    """Exports a save file into a png image without opening a window, returns the exit status of the command"""
+    if not graph.open(save_file): return 1
+    try:
+        graph.export_file(image_file, transparent)
+    except (ValueError, MemoryError, OSError, pygame.error) as e:
+        print('Could not export %s: %s' %(save_file, str(e) or 'not enough memory'), file=sys.stderr)
+        return 1
+    return 0
+
+def convert_command(save_file, new_file, binary=None):
+    """Converts a save file into new_file without opening a window, see Graph.convert,
+    returns the exit status of the command"""
+    try:
+        if not graph.convert(save_file, new_file, binary): return 1
+    except (MemoryError, OSError) as e:
+        print('Could not convert %s: %s' %(save_file, str(e) or 'not enough memory'), file=sys.stderr)
+        return 1
+    return 0
+
+usage = '''usage: progression_graph.py [file.graph]
+       progression_graph.py export file.graph image.png [--transparent]
+       progression_graph.py convert file.graph new.graph [--binary|--text]'''
+
+def main(args):
+    """Command line entry point, returns the exit status. Runs the application, optionally opening a save file,
+    or the export command, which renders a save file into a png image with no background if --transparent is given,
+    or the convert command, which rewrites a save file in the binary or text format (by default the other one)"""
+    if args[:1] == ['export']:
+        if len(args) not in (3, 4) or args[3:] not in ([], ['--transparent']):
+            print(usage, file=sys.stderr)
+            return 2
+        return export_command(args[1], args[2], args[3:] == ['--transparent'])
+    if args[:1] == ['convert']:
+        if len(args) not in (3, 4) or args[3:] not in ([], ['--binary'], ['--text']):
+            print(usage, file=sys.stderr)
+            return 2
+        return convert_command(args[1], args[2], {'--binary': True, '--text': False}.get(''.join(args[3:])))
+
+    if len(args) > 1 or args[:1] and args[0].startswith('-'):
+        print(usage, file=sys.stderr)
+        return 2
+    editor(*args)
+    return 0
+
+# without the application window, when imported as a library or for the commands, pygame renders without a display
+# (SDL dummy video driver) and the errors are printed instead of shown in popups
+headless = __name__ != '__main__' or sys.argv[1:2] in (['export'], ['convert'])
+if headless:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    Error.popups = False
+
+FPS = 60 # maximum FPS, the screen is only redrawn when something changed
 pygame.init()
 pygame.key.set_repeat(400, 30)
 
 screen = pygame.display.set_mode((Graph.W, Graph.H), RESIZABLE)
-hwnd = pygame.display.get_wm_info()['window']
 set_title(None)
 font = pygame.font.SysFont('consolas', 16)
 font2 = pygame.font.SysFont('consolas', 12)
@@ -1507,22 +3752,5 @@ char_w2 = font2.render('_', True, Palette.text).get_width()
 
 graph = Graph()
 
-dt = 0 # time passed in last frame, in seconds
-run = True
-while run:
-    active = hwnd == win32gui.GetForegroundWindow() and pygame.mouse.get_focused()
-    FPS = _FPS if active else _FPS/10
-
-    # pygame event loop
-    events = pygame.event.get()
-    for event in events:
-        if event.type == QUIT:
-            quit_app()
-        elif event.type == VIDEORESIZE:
-            graph.resize()
-
-    graph.update(events)
-    pygame.display.flip()
-    dt = clock.tick(FPS)/1000
-
-pygame.quit()
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+"""Copy of the graph by the autosave, spread over frames while the graph is edited.
+
+Run with: python -m pytest tests"""
+
+import gc, os, sys
+from random import Random
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import Autosave, Error, Manager, graph
+
+def edit(rng):
+    """Removes or adds a random node or link, the way the interface does"""
+    op = rng.random()
+    if op < 0.3 and Manager.nodes:
+        node = rng.choice(list(Manager.nodes.values()))
+        graph.edited(node, links=True)
+        Manager.delete_node(node)
+    elif op < 0.55 and Manager.links:
+        link = rng.choice(list(Manager.links.values()))
+        graph.edited(link)
+        Manager.delete_link(link)
+    elif op < 0.8:
+        graph.edited(Manager.new_node(rng.random(), rng.random(), 0, 0))
+    elif len(Manager.nodes) > 1:
+        n1, n2 = rng.sample(list(Manager.nodes.values()), 2)
+        if Manager.get_link(n1, n2) is None: graph.edited(Manager.new_link(n1.id, n2.id))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_copy_while_editing(seed, monkeypatch):
+    rng = Random(seed)
+    monkeypatch.setattr(Autosave, 'interval', 0)
+    monkeypatch.setattr(Autosave, 'frame_budget', 0) # 64 objects per frame
+    monkeypatch.setattr(Autosave, 'skip_chunk', rng.choice((1, 3, 256)))
+    snapshots = []
+    monkeypatch.setattr(Autosave, 'write_side', lambda self, snapshot, generation: snapshots.append(snapshot))
+
+    Manager.reset()
+    graph.autosave.cancel()
+    for _ in range(1000): Manager.new_node(rng.random(), rng.random(), 0, 0)
+    for _ in range(1000):
+        n1, n2 = rng.sample(list(Manager.nodes), 2)
+        if Manager.get_link(Manager.nodes[n1], Manager.nodes[n2]) is None: Manager.new_link(n1, n2)
+    graph.edited(Manager.nodes[0])
+
+    while True:
+        graph.autosave.update(graph)
+        if not graph.autosave.copying(): break
+        if rng.random() < 0.05:
+            for _ in range(rng.choice((1, 5, 40))): edit(rng)
+    graph.autosave.thread.join()
+
+    # same merge as Autosave.write_side
+    nodes, links, edited = snapshots[0][4:]
+    nodes, links = ({row[0]: row for row in rows} for rows in (nodes, links))
+    for rows, changes in zip((nodes, links), edited):
+        for id, row in changes.items():
+            if row is None: rows.pop(id, None)
+            else: rows[id] = row
+    assert nodes == {id: Autosave.copy(node) for id, node in Manager.nodes.items()}
+    assert links == {id: Autosave.copy(link) for id, link in Manager.links.items()}
+
+def test_restored_untitled_side_file_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(Autosave, 'folder', str(tmp_path / 'autosaves'))
+    monkeypatch.setattr(Autosave, 'interval', 0)
+    monkeypatch.setitem(Autosave.recover.__globals__, 'ask_button', lambda message, buttons: 0) # Yes
+
+    # autosave of an untitled graph, left after a crash
+    graph.newfile()
+    graph.edited(Manager.new_node(0, 0, 0, 0))
+    while True:
+        graph.autosave.update(graph)
+        if not graph.autosave.copying(): break
+    graph.autosave.thread.join()
+    side = Autosave.side_file(None)
+    assert os.path.exists(side)
+
+    # restored at the next start, then saved under a name
+    monkeypatch.setattr(graph, 'autosave', Autosave())
+    graph.autosave.recover(graph)
+    assert graph.save_file is None and len(Manager.nodes) == 1
+    graph.save_file = str(tmp_path / 'new.graph')
+    graph.save()
+    assert not os.listdir(Autosave.folder)
+
+def test_restore_gc(tmp_path, monkeypatch):
+    monkeypatch.setattr(Autosave, 'folder', str(tmp_path))
+    monkeypatch.setattr(Autosave, 'interval', 0)
+    monkeypatch.setattr(Autosave, 'frame_budget', 0) # 64 objects per frame
+    interval = sys.getswitchinterval()
+    graph.newfile()
+    for _ in range(1000): Manager.new_node(0, 0, 0, 0)
+
+    # cancelled during the copy
+    graph.edited(Manager.nodes[0])
+    graph.autosave.update(graph)
+    assert graph.autosave.copying() and not gc.isenabled()
+    graph.autosave.cancel()
+    assert gc.isenabled()
+
+    # written by the worker thread, without any frame afterwards
+    graph.edited(Manager.nodes[0])
+    while True:
+        graph.autosave.update(graph)
+        if not graph.autosave.copying(): break
+    graph.autosave.thread.join()
+    assert gc.isenabled() and sys.getswitchinterval() == interval
+
+def test_failed_autosave_shown(tmp_path, monkeypatch):
+    folder = tmp_path / 'autosaves'
+    folder.write_text('') # a file instead of a folder, the side file cannot be written
+    monkeypatch.setattr(Autosave, 'folder', str(folder))
+    monkeypatch.setattr(Autosave, 'interval', 0)
+    messages = []
+    monkeypatch.setattr(Error, 'popup', staticmethod(messages.append))
+
+    graph.newfile()
+    graph.edited(Manager.new_node(0, 0, 0, 0))
+    while True:
+        graph.autosave.update(graph)
+        if not graph.autosave.copying(): break
+    graph.autosave.thread.join()
+    assert not messages
+
+    # shown by the main thread at the next frame, once, and the screen under the popup is redrawn
+    graph.redraw_all = False
+    graph.autosave.update(graph)
+    assert graph.redraw_all
+    graph.autosave.update(graph)
+    assert len(messages) == 1 and 'Could not autosave' in messages[0]
@@ -0,0 +1,26 @@
+"""Export of a save file into a png image.
+
+Run with: python -m pytest tests"""
+
+import os, sys
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import graph
+
+save_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'minecraft.graph')
+
+@pytest.mark.parametrize('transparent', (False, True))
+def test_export_camera_zoom(tmp_path, transparent):
+    assert graph.open(save_file)
+
+    # the image is rendered at zoom 1, whatever the zoom of the camera
+    images = []
+    for zoom in (1, 0.9, 0.4):
+        graph.zoom = zoom
+        file = str(tmp_path / ('%g.png' %zoom))
+        graph.export_file(file, transparent)
+        with open(file, 'rb') as f: images.append(f.read())
+    assert images[1] == images[0] and images[2] == images[0]
@@ -0,0 +1,22 @@
+"""Links drawn in batches by Link.draw_all.
+
+Run with: python -m pytest tests"""
+
+import os, sys
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pygame
+from pygame.locals import SRCALPHA
+from progression_graph import Link, Palette, np
+
+@pytest.mark.skipif(np is None, reason='the lines are only rasterized into the pixels with NumPy')
+def test_rasterize_per_pixel_alpha():
+    # export surfaces have per-pixel alpha, their mapped colors are negative integers
+    surf = pygame.Surface((20, 10), SRCALPHA)
+    col = Palette.link[0][0]
+    assert Link.rasterize(surf, np.array([1.]), np.array([5.]), np.array([18.]), np.array([5.]), col)
+    assert surf.get_at((1, 5)) == surf.get_at((18, 5)) == pygame.Color(*col)
+    assert surf.get_at((10, 2)).a == 0
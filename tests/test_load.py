@@ -0,0 +1,75 @@
+"""Loading of corrupted save files.
+
+Run with: python -m pytest tests"""
+
+import gc, os, sys, weakref
+from zipfile import ZipFile
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import Error, Manager, graph, np
+
+def test_duplicate_ids(tmp_path):
+    file = str(tmp_path / 'duplicate.graph')
+    with ZipFile(file, 'w') as z:
+        z.writestr('save.txt', 'P 0 0 0 0 0\nP 1 0 0 0 1\nP 5 5 0 1 1\nL 0 1 0\nL 1 0 0\n')
+    graph.open(file)
+
+    # the second node and link with the same IDs are skipped, instead of staying in the indexes
+    assert sorted(Manager.nodes) == [0, 1] and Manager.nodes[1].x == 1
+    assert len(Manager.draw_order) == 2
+    assert len(Manager.grid.nodes_in_rect(-10, -10, 10, 10)) == 2
+    assert list(Manager.links) == [0] and len(Manager.link_pairs) == 1
+    assert all(len(links) == 1 for links in Manager.node_links.values())
+
+    with pytest.raises(ValueError):
+        Manager.new_node(0, 0, 0, 0, 1)
+    assert len(Manager.draw_order) == 2
+
+@pytest.mark.skipif(np is None, reason='the node arrays and their reference cycle only exist with NumPy')
+def test_reopen_collects_previous_graph(tmp_path):
+    file = str(tmp_path / 'graph.graph')
+    with ZipFile(file, 'w') as z:
+        z.writestr('save.txt', ''.join('P %d 0 0 0 %d\n' %(i, i) for i in range(100)))
+
+    graph.open(file)
+    store = weakref.ref(Manager.store)
+    graph.open(file)
+    graph.open(file)
+    # the previous graph is not kept alive by the new one, Node.store and NodeStore.nodes make a cycle
+    gc.collect()
+    assert store() is None
+
+def test_open_keeps_host_gc_state(tmp_path):
+    file = str(tmp_path / 'graph.graph')
+    with ZipFile(file, 'w') as z:
+        z.writestr('save.txt', 'P 0 0 0 0 0\n')
+
+    # imported as a library, the objects frozen by the host program stay frozen, and nothing else is frozen
+    gc.freeze()
+    try:
+        frozen = gc.get_freeze_count()
+        graph.open(file)
+        graph.open(file)
+        # objects of the previous graph frozen by the host program can be freed meanwhile
+        assert 0 < gc.get_freeze_count() <= frozen and gc.isenabled()
+    finally:
+        gc.unfreeze()
+
+def test_background_open_error(tmp_path, monkeypatch):
+    file = str(tmp_path / 'graph.graph')
+    with ZipFile(file, 'w') as z:
+        z.writestr('save.txt', 'P 0 0 0 0 0\n')
+    graph.open(file)
+
+    def load(save_file): raise RuntimeError('worker failed')
+    messages = []
+    monkeypatch.setattr(graph, 'load', load)
+    monkeypatch.setattr(Error, 'popup', staticmethod(messages.append))
+    assert not graph.open(file, True)
+
+    # the error is shown, and the previous graph is restored
+    assert len(messages) == 1 and 'RuntimeError: worker failed' in messages[0]
+    assert list(Manager.nodes) == [0]
@@ -0,0 +1,30 @@
+"""Rendering of the density cells (level of detail 3).
+
+Run with: python -m pytest tests"""
+
+import os, sys
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import Graph, Manager, Palette, graph, np, screen
+
+@pytest.mark.skipif(np is None, reason='the density cells are only computed from the NumPy arrays with NumPy')
+@pytest.mark.parametrize('state', (0, 1, 2))
+def test_density_single_node(state):
+    Manager.reset()
+    Manager.new_node(0, 0, 0, state)
+    graph.scroll_x = graph.scroll_y = 0
+    graph.zoom = 0.01
+    assert graph.lod() == 3
+
+    x, y = graph.project(0, 0)
+    cell = Graph.density_cell
+    counts = [0, 0, 0]
+    counts[state] = 1
+    assert Manager.store.density(graph, cell) == {(int(x//cell), int(y//cell)): counts}
+
+    graph.redraw_all = True
+    graph.render([], (0, 0), False)
+    assert screen.get_at((int(x), int(y)))[:3] != Palette.background[:3]
@@ -0,0 +1,52 @@
+"""Nodes and links returned by SpatialGrid.query, against checking every node and clipping every link.
+
+Run with: python -m pytest tests"""
+
+import os, sys
+from random import Random
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from progression_graph import SpatialGrid, np
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+class Segment:
+    def __init__(self, n1, n2):
+        self.n1, self.n2 = n1, n2
+
+@pytest.mark.parametrize('vectorized', (False, True))
+@pytest.mark.parametrize('seed', range(3))
+def test_query_links(seed, vectorized):
+    if vectorized and np is None: pytest.skip('the links are only clipped all at once with NumPy')
+    rng = Random(seed)
+    grid = SpatialGrid()
+    if not vectorized: grid.ends = None
+    nodes = [Point(rng.uniform(0, 100), rng.uniform(0, 100)) for _ in range(300)]
+    links = [Segment(*rng.sample(nodes, 2)) for _ in range(1000)]
+    for node in nodes: grid.add_node(node)
+    for link in links: grid.add_link(link)
+
+    # moved and removed links, their cells change
+    for node in rng.sample(nodes, 50):
+        node.x, node.y = rng.uniform(0, 100), rng.uniform(0, 100)
+        grid.move_node(node)
+    for link in links: grid.update_link(link)
+    for link in rng.sample(links, 200):
+        grid.remove_link(link)
+        links.remove(link)
+
+    for size in (2, 10, 40, 90):
+        for _ in range(20):
+            x, y = rng.uniform(-10, 100), rng.uniform(-10, 100)
+            rect = (x, y, x+size, y+size*0.6)
+            expected = {link for link in links if SpatialGrid.segment_in_rect(link.n1.x, link.n1.y, link.n2.x, link.n2.y, rect)}
+            found_nodes, found_links = grid.query(rect)
+            assert found_links == expected
+            x0, y0, x1, y1 = (v // SpatialGrid.cell_size for v in rect) # nodes of the cells overlapping rect
+            assert found_nodes == {node for node in nodes if x0 <= node.x // SpatialGrid.cell_size <= x1
+                                                     and y0 <= node.y // SpatialGrid.cell_size <= y1}